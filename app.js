@@ -1,9 +1,23 @@
+// Search as the user types, once they pause; Enter still searches immediately
+const SEARCH_DEBOUNCE_MS = 250;
+const SEARCH_MIN_LENGTH = 2;
+let searchTimer = null;
+let searchSequence = 0;
+
 function handleKeyPress(event) {
     if (event.key === 'Enter') {
+        clearTimeout(searchTimer);
         searchSongs();
     }
 }
 
+function handleSearchInput() {
+    clearTimeout(searchTimer);
+    const query = document.getElementById('songSearch').value.trim();
+    if (query.length < SEARCH_MIN_LENGTH) return;
+    searchTimer = setTimeout(() => searchSongs({ quiet: true }), SEARCH_DEBOUNCE_MS);
+}
+
 let currentTracks = [];
 
 function showSelectedSong(track) {
@@ -42,20 +56,25 @@ function getPopularityClass(popularity) {
     return 'low-popularity';
 }
 
-async function searchSongs() {
-    const query = document.getElementById('songSearch').value;
+async function searchSongs({ quiet = false } = {}) {
+    const query = document.getElementById('songSearch').value.trim();
     if (!query) return;
     
-    // Add pulse effect to search button
-    const searchBtn = document.getElementById('searchButton');
-    searchBtn.classList.add('search-pulse');
-    setTimeout(() => {
-        searchBtn.classList.remove('search-pulse');
-    }, 600);
+    // Add pulse effect to search button, unless this is a search-as-you-type request
+    if (!quiet) {
+        const searchBtn = document.getElementById('searchButton');
+        searchBtn.classList.add('search-pulse');
+        setTimeout(() => {
+            searchBtn.classList.remove('search-pulse');
+        }, 600);
+    }
     
+    // Responses can arrive out of order while typing; only the latest search is shown
+    const sequence = ++searchSequence;
     try {
         const response = await fetch(`/api/search?q=${encodeURIComponent(query)}`);
         const data = await response.json();
+        if (sequence !== searchSequence || !data.tracks) return;
         displaySearchResults(data.tracks.items);
     } catch (error) {
         console.error('Search failed:', error);
@@ -128,7 +147,7 @@ async function getAIRecommendations(trackId) {
 
     
     try {
-        const response = await fetch('/api/ai-recommendations', {
+        const response = await fetch('/api/ai-recommendations/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -139,31 +158,40 @@ async function getAIRecommendations(trackId) {
             })
         });
         
-        const data = await response.json();
-        
-        if (data.error) {
+        if (!response.ok) {
+            const data = await response.json();
             console.error('API Error:', data.error, data.debug);
             document.getElementById('recommendations').innerHTML = `<p>Error: ${data.error}</p>`;
             return;
         }
         
-        console.log('Debug info:', data.debug);
+        // Tracks are shown as soon as the server selects them; details and final order follow
+        let gridDiv = null;
+        let count = 0;
         
-        // First fade out the user input section
-        const userInputSection = document.querySelector('.user-input-section');
-        if (userInputSection) {
-            userInputSection.style.transition = 'all 0.5s ease-out';
-            userInputSection.style.opacity = '0';
-            userInputSection.style.transform = 'translateY(-20px)';
+        await readEventStream(response, (event, data) => {
+            if (!gridDiv) {
+                gridDiv = startRecommendations();
+            }
             
-            setTimeout(() => {
-                userInputSection.remove();
-                // Then display recommendations after input section is gone
-                displayRecommendations(data.tracks);
-            }, 500);
-        } else {
-            displayRecommendations(data.tracks);
-        }
+            if (event === 'track') {
+                gridDiv.appendChild(createRecommendationCard(data, count++));
+            } else if (event === 'details') {
+                const card = gridDiv.querySelector(`[data-track-id="${data.id}"]`);
+                if (card && data.ai_explanation) {
+                    card.setAttribute('data-explanation', data.ai_explanation);
+                    card.classList.add('has-explanation');
+                }
+            } else if (event === 'done') {
+                console.log('Debug info:', data.debug);
+                data.order.forEach(id => {
+                    const card = gridDiv.querySelector(`[data-track-id="${id}"]`);
+                    if (card) {
+                        gridDiv.appendChild(card);
+                    }
+                });
+            }
+        });
     } catch (error) {
         console.error('AI Recommendations failed:', error);
         document.getElementById('recommendations').innerHTML = `<p>Error: ${error.message}</p>`;
@@ -174,6 +202,53 @@ async function getAIRecommendations(trackId) {
     }
 }
 
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Server-Sent Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const chunk = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            chunk.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+}
+
+function startRecommendations() {
+    // Fade out the user input section while the first recommendations arrive
+    const userInputSection = document.querySelector('.user-input-section');
+    if (userInputSection) {
+        userInputSection.style.transition = 'all 0.5s ease-out';
+        userInputSection.style.opacity = '0';
+        userInputSection.style.transform = 'translateY(-20px)';
+        
+        setTimeout(() => {
+            userInputSection.remove();
+        }, 500);
+    }
+    
+    const recDiv = document.getElementById('recommendations');
+    recDiv.innerHTML = '<h3>Recommended Songs:</h3><div class="recommendations-grid"></div>';
+    return recDiv.querySelector('.recommendations-grid');
+}
+
 function handleDescriptionKeyPress(event, trackId) {
     if (event.key === 'Enter' && !event.shiftKey) {
         event.preventDefault();
@@ -181,37 +256,32 @@ function handleDescriptionKeyPress(event, trackId) {
     }
 }
 
-function displayRecommendations(tracks) {
-    const recDiv = document.getElementById('recommendations');
-    recDiv.innerHTML = '<h3>Recommended Songs:</h3><div class="recommendations-grid"></div>';
-    const gridDiv = recDiv.querySelector('.recommendations-grid');
+function createRecommendationCard(track, index) {
+    const div = document.createElement('div');
+    const popularityClass = getPopularityClass(track.popularity || 50);
+    div.className = `song-item ${popularityClass} slide-in`;
+    div.style.animationDelay = `${index * 0.1}s`;
+    div.setAttribute('data-track-id', track.id);
     
-    tracks.forEach((track, index) => {
-        const div = document.createElement('div');
-        const popularityClass = getPopularityClass(track.popularity || 50);
-        div.className = `song-item ${popularityClass} slide-in`;
-        div.style.animationDelay = `${index * 0.1}s`;
-        
-        const songInfo = document.createElement('div');
-        songInfo.className = 'song-info';
-        songInfo.innerHTML = `
-            <div class="song-title">${track.name}</div>
-            <div class="song-artist">${track.artists[0].name}</div>
-        `;
-        
-        const linkDiv = document.createElement('div');
-        if (track.external_urls.spotify) {
-            linkDiv.innerHTML = `<a href="${track.external_urls.spotify}" target="_blank" class="spotify-link">Listen on Spotify</a>`;
-        }
-        
-        // Add hover tooltip for AI explanation
-        if (track.ai_explanation) {
-            div.setAttribute('data-explanation', track.ai_explanation);
-            div.classList.add('has-explanation');
-        }
-        
-        div.appendChild(songInfo);
-        div.appendChild(linkDiv);
-        gridDiv.appendChild(div);
-    });
+    const songInfo = document.createElement('div');
+    songInfo.className = 'song-info';
+    songInfo.innerHTML = `
+        <div class="song-title">${track.name}</div>
+        <div class="song-artist">${track.artists[0].name}</div>
+    `;
+    
+    const linkDiv = document.createElement('div');
+    if (track.external_urls.spotify) {
+        linkDiv.innerHTML = `<a href="${track.external_urls.spotify}" target="_blank" class="spotify-link">Listen on Spotify</a>`;
+    }
+    
+    // Add hover tooltip for AI explanation
+    if (track.ai_explanation) {
+        div.setAttribute('data-explanation', track.ai_explanation);
+        div.classList.add('has-explanation');
+    }
+    
+    div.appendChild(songInfo);
+    div.appendChild(linkDiv);
+    return div;
 }
\ No newline at end of file
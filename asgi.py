@@ -0,0 +1,504 @@
+"""Async serving mode: the same routes as server.py on an ASGI server.
+
+Spotify calls go through a non-blocking httpx client and the pipeline's model calls are
+awaited on the shared batch schedulers, so one process can hold many in-flight recommendations.
+
+    uvicorn asgi:app --port 8000
+"""
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.responses import JSONResponse as StarletteJSONResponse
+from starlette.routing import Route
+
+import server
+from metrics import in_context, registry as metrics
+from models import registry as model_registry
+from payload import choose_encoding, compress, compressible, compressible_type, dumps, parse_fields
+from singleflight import AsyncSingleFlight
+from spotify_client import API_URL, AsyncSpotifyClient
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Threads for model work outside the pipeline (warm-up, sentiment-keyed cache lookups); the
+# pipeline's own model calls are awaited without holding one
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix='inference')
+
+spotify = AsyncSpotifyClient(
+    timeout=float(os.getenv('SPOTIFY_TIMEOUT_SECONDS', '10')),
+    max_retries=int(os.getenv('SPOTIFY_MAX_RETRIES', '3')),
+    rate_limit=float(os.getenv('SPOTIFY_RATE_LIMIT', '0')),
+    pool_size=int(os.getenv('SPOTIFY_POOL_SIZE', '20')),
+    api_url=os.getenv('SPOTIFY_API_URL', API_URL)
+)
+# Share the sync client's limiter so both serving modes respect one request budget
+spotify.rate_limiter = server.spotify.rate_limiter
+spotify.on_response = server.observe_upstream
+spotify.token_manager = server.token_manager
+
+# Caches and the feature index are shared with the sync code paths
+response_cache = server.response_cache
+feature_index = server.feature_index
+
+# Concurrent identical Spotify calls and recommendation requests share one in-flight execution
+in_flight = AsyncSingleFlight()
+metrics.register_stats('async_in_flight', in_flight.stats)
+
+search_semaphore = None
+
+
+class JSONResponse(StarletteJSONResponse):
+    """JSON bodies through payload.dumps, like server.py's FastJSONProvider"""
+
+    def render(self, content):
+        with metrics.span('serialize'):
+            return dumps(content)
+
+
+class CompressResponses:
+    """gzip or brotli for JSON and static files, as server.py's compress_response does.
+
+    Event streams pass through untouched; other bodies are buffered and compressed whole.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding')) if scope['type'] == 'http' else None
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+        chunks = []
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                passthrough = (
+                    message['status'] != 200 or 'content-encoding' in headers
+                    or not compressible_type(headers.get('content-type'))
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            chunks.append(message.get('body', b''))
+            if message.get('more_body', False):
+                return
+            body = b''.join(chunks)
+            headers = MutableHeaders(raw=start['headers'])
+            if compressible(headers.get('content-type', ''), len(body)):
+                with metrics.span('compress'):
+                    body = compress(body, encoding)
+                headers['Content-Encoding'] = encoding
+                headers['Content-Length'] = str(len(body))
+                headers.add_vary_header('Accept-Encoding')
+                # The body is no longer byte-for-byte the one the ETag was computed from
+                etag = headers.get('etag')
+                if etag and not etag.startswith('W/'):
+                    headers['ETag'] = f'W/{etag}'
+            await send(start)
+            await send({'type': 'http.response.body', 'body': body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+async def run_inference(fn, *args):
+    loop = asyncio.get_running_loop()
+    # Run in the request's context so spans inside server functions land on its trace
+    return await loop.run_in_executor(inference_executor, functools.partial(in_context(fn), *args))
+
+
+async def get_access_token():
+    # peek() never waits, even while a background refresh is running
+    token = server.token_manager.peek()
+    if token:
+        return token
+    # Only the first request (or one after an outage) has to wait for the token endpoint
+    return await asyncio.to_thread(server.get_access_token)
+
+
+# The cache, track store and feature index calls below read and write SQLite or .npy files, so
+# they run on worker threads; only Spotify requests themselves are awaited on the event loop
+
+async def get_track(track_id, token):
+    found, _ = await asyncio.to_thread(server.cached_tracks, [track_id])
+    if track_id in found:
+        return found[track_id]
+    return await in_flight.do(('track', track_id), fetch_track, track_id, token)
+
+
+async def fetch_track(track_id, token):
+    try:
+        response = await spotify.get(f'/tracks/{track_id}', token)
+        return await asyncio.to_thread(server.track_from_response, response)
+    except Exception as e:
+        print(f"Track lookup error: {e}")
+    return None
+
+
+async def get_tracks(track_ids, token):
+    tracks, missing = await asyncio.to_thread(server.cached_tracks, track_ids)
+
+    for start in range(0, len(missing), server.TRACKS_BATCH_SIZE):
+        chunk = missing[start:start + server.TRACKS_BATCH_SIZE]
+        try:
+            response = await spotify.get('/tracks', token, params={'ids': ','.join(chunk), 'market': 'US'})
+            tracks.update(await asyncio.to_thread(server.tracks_from_response, response))
+        except Exception as e:
+            print(f"Tracks batch error: {e}")
+
+    return tracks
+
+
+async def spotify_search(query, token, limit=5):
+    key = server.search_cache_key(query, limit)
+    cached = await asyncio.to_thread(response_cache.get, 'search', key)
+    if cached is not None:
+        return 200, cached
+    # Callers annotate the returned tracks, so each one gets its own copy
+    return await in_flight.do(('search', key), fetch_search, query, token, limit, key, copy_result=True)
+
+
+async def fetch_search(query, token, limit, key):
+    response = await spotify.get('/search', token, params=server.search_params(query, limit))
+    return await asyncio.to_thread(server.search_from_response, response, key)
+
+
+async def search_concurrently(queries, token, limit, deadline):
+    """Async counterpart of server.search_concurrently"""
+    async def search(query):
+        async with search_semaphore:
+            return await spotify_search(query, token, limit)
+
+    tasks = [asyncio.ensure_future(search(query)) for query in queries]
+    if tasks:
+        await asyncio.wait(tasks, timeout=max(0, deadline - time.monotonic()))
+
+    results = []
+    for query, task in zip(queries, tasks):
+        if not task.done():
+            task.cancel()
+            print(f"Search timed out: {query}")
+            results.append(None)
+        elif task.exception():
+            print(f"Search error: {task.exception()}")
+            results.append(None)
+        else:
+            results.append(task.result())
+    return results
+
+
+async def get_audio_features(track_id, token):
+    found, _ = await asyncio.to_thread(server.cached_audio_features, [track_id])
+    if track_id in found:
+        return found[track_id]
+    return await in_flight.do(('audio_features', track_id), fetch_audio_features, track_id, token)
+
+
+async def fetch_audio_features(track_id, token):
+    try:
+        response = await spotify.get(f'/audio-features/{track_id}', token)
+        return await asyncio.to_thread(server.audio_features_from_response, response)
+    except Exception as e:
+        print(f"Audio features error: {e}")
+    return None
+
+
+async def get_audio_features_batch(track_ids, token):
+    features, missing = await asyncio.to_thread(server.cached_audio_features, track_ids)
+
+    for start in range(0, len(missing), server.AUDIO_FEATURES_BATCH_SIZE):
+        chunk = tuple(missing[start:start + server.AUDIO_FEATURES_BATCH_SIZE])
+        features.update(await in_flight.do(('audio_features_batch', chunk), fetch_audio_features_chunk, chunk, token))
+
+    return features
+
+
+async def fetch_audio_features_chunk(chunk, token):
+    try:
+        response = await spotify.get('/audio-features', token, params={'ids': ','.join(chunk)})
+        return await asyncio.to_thread(server.audio_features_batch_from_response, response)
+    except Exception as e:
+        print(f"Audio features batch error: {e}")
+    return {}
+
+
+async def model_results(call):
+    """Await a server.ModelCall's results without holding a thread while its batch runs"""
+    futures = call.submit()
+    if not futures:
+        return []
+    try:
+        _, pending = await asyncio.wait([asyncio.wrap_future(future) for future in futures], timeout=call.timeout)
+    except asyncio.CancelledError:
+        call.abandon([future for future in futures if not future.done()])
+        raise
+    if pending:
+        call.abandon([future for future in futures if not future.done()])
+        raise call.timed_out()
+    return [future.result() for future in futures]
+
+
+# Pipeline steps with a non-blocking counterpart here; the rest (store lookups, the feature
+# index) run on a worker thread
+ASYNC_STEPS = {
+    server.get_audio_features: get_audio_features,
+    server.get_audio_features_batch: get_audio_features_batch,
+    server.get_tracks: get_tracks,
+    server.search_concurrently: search_concurrently,
+}
+
+
+async def run_step(call):
+    if isinstance(call, server.ModelCall):
+        return await model_results(call)
+    if call.fn in ASYNC_STEPS:
+        return await ASYNC_STEPS[call.fn](*call.args)
+    return await asyncio.to_thread(call.fn, *call.args)
+
+
+async def recommendation_events(track_data, user_description, token, budget):
+    """Drive server.recommendation_steps, yielding the same events as server.recommendation_events"""
+    steps = server.recommendation_steps(track_data, user_description, token, budget)
+    result, error = None, None
+    try:
+        while True:
+            try:
+                step = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration:
+                return
+            result, error = None, None
+            if isinstance(step, (server.Call, server.ModelCall)):
+                try:
+                    result = await run_step(step)
+                except Exception as e:
+                    error = e
+            else:
+                yield step
+    finally:
+        steps.close()
+
+
+async def collect_recommendations(track_data, user_description, token, budget):
+    async for event, payload in recommendation_events(track_data, user_description, token, budget):
+        if event == 'done':
+            return payload, list(budget.skipped)
+
+
+async def prepare_recommendation_request(request):
+    """Returns ((track_data, user_description, token, budget), None) or (None, error response)"""
+    data = await request.json()
+    track_id = data.get('trackId')
+    user_description = data.get('userDescription', '')
+
+    if not track_id:
+        return None, JSONResponse({'error': 'Track ID required'}, 400)
+
+    try:
+        budget = server.parse_budget(request.query_params.get('budget'))
+    except ValueError as e:
+        return None, JSONResponse({'error': str(e)}, 400)
+
+    token = await get_access_token()
+    if not token:
+        return None, JSONResponse({'error': 'Failed to get access token'}, 500)
+
+    with metrics.span('track'):
+        track_data = await get_track(track_id, token)
+    if not track_data:
+        return None, JSONResponse({'error': 'Track not found'}, 404)
+
+    return (track_data, user_description, token, budget), None
+
+
+async def index(request):
+    return FileResponse(os.path.join(ROOT, 'index.html'))
+
+
+async def static_files(request):
+    path = os.path.realpath(os.path.join(ROOT, request.path_params['filename']))
+    if not path.startswith(ROOT + os.sep) or not os.path.isfile(path):
+        return Response('Not Found', 404)
+    return FileResponse(path)
+
+
+async def search_songs(request):
+    query = request.query_params.get('q')
+    if not query:
+        return JSONResponse({'error': 'Query required'}, 400)
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+
+    local = server.local_search_body(query, fields)
+    if local is not None:
+        return JSONResponse(local, headers={'X-Search-Source': 'local'})
+
+    token = await get_access_token()
+    with metrics.span('search'):
+        status_code, results = await spotify_search(query, token, limit=5)
+
+    if status_code != 200:
+        return JSONResponse({'error': f'Spotify API error: {status_code}', 'details': results}, status_code)
+
+    return JSONResponse(server.spotify_search_body(results, fields), headers={'X-Search-Source': 'spotify'})
+
+
+async def cached_recommendations(request):
+    data = await request.json()
+    args = (data.get('trackId'), data.get('userDescription', ''))
+    # Only sentiment-bucketed keys need a model call; other lookups must not queue behind
+    # generation on the inference pool, so hot seeds come straight back from the cache
+    if server.RESULT_CACHE_KEY == 'sentiment':
+        return await run_inference(server.cached_recommendations, *args)
+    return await asyncio.to_thread(server.cached_recommendations, *args)
+
+
+async def get_ai_recommendations(request):
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    cache_key, recommendations, cache_status = await cached_recommendations(request)
+
+    if recommendations is None:
+        seed, error = await prepare_recommendation_request(request)
+        if error:
+            return error
+
+        # Identical requests arriving while this one runs wait for its result, unless their own
+        # budget ends before this one's
+        recommendations, skipped = await in_flight.do(
+            ('recommendations', cache_key), collect_recommendations, *seed, deadline=seed[3].deadline
+        )
+        server.store_recommendations(cache_key, recommendations, skipped)
+    else:
+        skipped = []
+
+    return JSONResponse(server.recommendations_body(recommendations, skipped, fields), headers={'X-Cache': cache_status})
+
+
+async def replay_recommendation_events(recommendations):
+    for event in server.replay_recommendation_events(recommendations):
+        yield event
+
+
+async def stream_ai_recommendations(request):
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    cache_key, cached, cache_status = await cached_recommendations(request)
+
+    if cached is None:
+        seed, error = await prepare_recommendation_request(request)
+        if error:
+            return error
+        budget = seed[3]
+        events = recommendation_events(*seed)
+    else:
+        budget = None
+        events = replay_recommendation_events(cached)
+
+    async def generate():
+        async for event, payload in events:
+            skipped = list(budget.skipped) if budget else []
+            if event == 'done' and cached is None:
+                server.store_recommendations(cache_key, payload, skipped)
+            yield server.recommendation_event(event, payload, skipped, fields)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Cache': cache_status}
+    )
+
+
+async def prometheus_metrics(request):
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+async def trace_requests(request, call_next):
+    """Start a trace per request and report it like server.py's request hooks"""
+    trace = metrics.start_trace()
+    response = await call_next(request)
+    endpoint = getattr(request.scope.get('endpoint'), '__name__', 'unknown')
+    if server.SERVER_TIMING:
+        response.headers['Server-Timing'] = trace.server_timing()
+    metrics.inc('requests', endpoint=endpoint, status=response.status_code)
+    metrics.observe('request_seconds', trace.elapsed(), endpoint=endpoint)
+    return response
+
+
+async def readiness(request):
+    ready = model_registry.ready(server.REQUIRED_MODELS)
+    return JSONResponse({'models': model_registry.status(), 'ready': ready}, 200 if ready else 503)
+
+
+async def warm_up_models(request):
+    models = await run_inference(model_registry.warm_up_required, server.REQUIRED_MODELS)
+    ready = model_registry.ready(server.REQUIRED_MODELS)
+    return JSONResponse({'models': models, 'ready': ready}, 200 if ready else 503)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global search_semaphore
+    search_semaphore = asyncio.Semaphore(server.SEARCH_CONCURRENCY)
+    # Startup runs in each worker, after any fork
+    server.start_seeding()
+    yield
+    await spotify.aclose()
+    inference_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/api/search', search_songs),
+        Route('/api/ai-recommendations', get_ai_recommendations, methods=['POST']),
+        Route('/api/ai-recommendations/stream', stream_ai_recommendations, methods=['POST']),
+        Route('/api/warmup', warm_up_models, methods=['POST']),
+        Route('/api/ready', readiness),
+        Route('/metrics', prometheus_metrics),
+        Route('/{filename:path}', static_files),
+    ],
+    middleware=[
+        # Any origin, method and header, like server.py's CORS(app)
+        Middleware(
+            CORSMiddleware, allow_origins=['*'],
+            allow_methods=['GET', 'HEAD', 'POST', 'OPTIONS', 'PUT', 'PATCH', 'DELETE'], allow_headers=['*']
+        ),
+        Middleware(BaseHTTPMiddleware, dispatch=trace_requests),
+        Middleware(CompressResponses),
+    ],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, port=8000)
@@ -0,0 +1 @@
+"""Offline benchmark harness: a fake Spotify API, stub models and a load driver"""
@@ -0,0 +1,232 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bench.fixtures import load_fixtures
+
+
+class FakeSpotify:
+    """Local stand-in for the Spotify Web API that replays fixtures.
+
+    Serves the token endpoint at /api/token and search, tracks and audio features under /v1.
+    Every request waits latency (+ up to jitter) seconds, and a throttle_rate share of them
+    is answered 429 with a Retry-After header. Calls are counted per endpoint class and
+    exposed at /_stats (reset with POST /_reset) so a server in another process can be measured.
+    """
+
+    def __init__(self, fixtures, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 throttle_rate=0.0, retry_after=1, seed=0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.throttled = {}
+
+        # Queries without a recorded answer match tracks by the words in their name and artist
+        self._ids = sorted(fixtures['tracks'])
+        self._words = {}
+        for track_id in self._ids:
+            track = fixtures['tracks'][track_id]
+            text = ' '.join([track['name']] + [artist['name'] for artist in track['artists']])
+            for word in set(re.findall(r'\w+', text.lower())):
+                self._words.setdefault(word, []).append(track_id)
+
+        handler = type('Handler', (_Handler,), {'fake': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return f"{self.url}/v1"
+
+    @property
+    def token_url(self):
+        return f"{self.url}/api/token"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-spotify', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'throttled': dict(self.throttled),
+                'total': sum(self.calls.values()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.throttled.clear()
+
+    def handle(self, method, path, params):
+        """Return (status, payload, headers) for one request"""
+        endpoint = self._classify(method, path, params)
+        if endpoint is None:
+            return 404, {'error': {'status': 404, 'message': 'Service not found'}}, {}
+
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            throttle = self._random.random() < self.throttle_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if throttle:
+                self.throttled[endpoint] = self.throttled.get(endpoint, 0) + 1
+
+        if delay:
+            time.sleep(delay)
+        if throttle:
+            return 429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}}, {'Retry-After': str(self.retry_after)}
+
+        tracks = self.fixtures['tracks']
+        features = self.fixtures['audio_features']
+        if endpoint == 'token':
+            return 200, {'access_token': 'bench-token', 'token_type': 'Bearer', 'expires_in': 3600}, {}
+        if endpoint == 'search':
+            limit = int(params.get('limit', ['20'])[0])
+            items = [tracks[track_id] for track_id in self._search(params.get('q', [''])[0], limit)]
+            return 200, {'tracks': {'items': items, 'limit': limit, 'offset': 0, 'total': len(items)}}, {}
+        if endpoint == 'tracks':
+            ids = params.get('ids', [''])[0].split(',')
+            return 200, {'tracks': [tracks.get(track_id) for track_id in ids]}, {}
+        if endpoint == 'audio_features':
+            ids = params.get('ids', [''])[0].split(',')
+            return 200, {'audio_features': [features.get(track_id) for track_id in ids]}, {}
+
+        track_id = path.rsplit('/', 1)[-1]
+        found = (tracks if endpoint == 'track' else features).get(track_id)
+        if found is None:
+            return 404, {'error': {'status': 404, 'message': 'Non existing id'}}, {}
+        return 200, found, {}
+
+    def _classify(self, method, path, params):
+        if method == 'POST' and path == '/api/token':
+            return 'token'
+        if method != 'GET':
+            return None
+        if path == '/v1/search':
+            return 'search'
+        if path == '/v1/tracks':
+            return 'tracks'
+        if path == '/v1/audio-features':
+            return 'audio_features'
+        if path.startswith('/v1/tracks/'):
+            return 'track'
+        if path.startswith('/v1/audio-features/'):
+            return 'audio_feature'
+        return None
+
+    def _search(self, query, limit):
+        recorded = self.fixtures['searches'].get(query) or self.fixtures['searches'].get(query.lower())
+        if recorded is not None:
+            return recorded[:limit]
+
+        scores = {}
+        for word in re.findall(r'\w+', query.lower()):
+            for track_id in self._words.get(word, ()):
+                scores[track_id] = scores.get(track_id, 0) + 1
+        matches = sorted(scores, key=lambda track_id: (-scores[track_id], track_id))[:limit]
+
+        # Pad with a stable pseudo-random pick so every query returns a full page
+        if len(matches) < limit and self._ids:
+            start = int(hashlib.md5(query.encode()).hexdigest(), 16) % len(self._ids)
+            for offset in range(len(self._ids)):
+                track_id = self._ids[(start + offset * 7) % len(self._ids)]
+                if track_id not in matches:
+                    matches.append(track_id)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == '/_stats':
+            return self._send(200, self.fake.stats(), {})
+        self._send(*self.fake.handle('GET', parsed.path, parse_qs(parsed.query)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        parsed = urlparse(self.path)
+        if parsed.path == '/_reset':
+            self.fake.reset()
+            return self._send(200, {'reset': True}, {})
+        self._send(*self.fake.handle('POST', parsed.path, parse_qs(parsed.query)))
+
+    def _send(self, status, payload, headers):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_arguments(parser):
+    parser.add_argument('--fixtures', help='recorded fixture file (default: synthetic catalog)')
+    parser.add_argument('--catalog-size', type=int, default=500, help='tracks in the synthetic catalog')
+    parser.add_argument('--latency-ms', type=float, default=50, help='added to every upstream response')
+    parser.add_argument('--jitter-ms', type=float, default=20, help='random extra latency, up to this much')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of requests answered 429')
+    parser.add_argument('--retry-after', type=float, default=1, help='Retry-After seconds sent with 429s')
+
+
+def from_arguments(args, host='127.0.0.1', port=0):
+    return FakeSpotify(
+        load_fixtures(args.fixtures, args.catalog_size),
+        host=host,
+        port=port,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after
+    )
+
+
+if __name__ == '__main__':
+    # python -m bench.fake_spotify --port 8900, then run a server with
+    # SPOTIFY_API_URL=http://127.0.0.1:8900/v1 SPOTIFY_TOKEN_URL=http://127.0.0.1:8900/api/token
+    parser = argparse.ArgumentParser(description='Fake Spotify API replaying fixtures')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = from_arguments(args, args.host, args.port)
+    print(f"Fake Spotify API at {fake.api_url} (token: {fake.token_url})")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import random
+
+# A fixture file is {"tracks": {id: track}, "audio_features": {id: features}, "searches": {query: [id, ...]}}
+# with the objects exactly as Spotify returns them; record.py captures one from the real API.
+
+ARTISTS = [
+    'Arctic Monkeys', 'Phoebe Bridgers', 'Daft Punk', 'Radiohead', 'Billie Eilish', 'Tame Impala',
+    'Kendrick Lamar', 'Fleetwood Mac', 'The Strokes', 'Lorde', 'Bon Iver', 'Frank Ocean',
+    'Mitski', 'Beach House', 'LCD Soundsystem', 'Florence + The Machine',
+]
+WORDS = [
+    'Midnight', 'Golden', 'Echoes', 'Neon', 'Summer', 'Glass', 'River', 'Ghost', 'Electric', 'Paper',
+    'Velvet', 'Signal', 'Motion', 'Silver', 'Wild', 'Static', 'Honey', 'Northern', 'Lights', 'Dreams',
+]
+# Real track objects list every market twice (track and album), which dominates their size
+MARKETS = (
+    'AD AE AG AL AM AO AR AT AU AZ BA BB BD BE BF BG BH BI BJ BN BO BR BS BT BW BY BZ CA CD CG CH CI '
+    'CL CM CO CR CV CW CY CZ DE DJ DK DM DO DZ EC EE EG ES ET FI FJ FM FR GA GB GD GE GH GM GN GQ GR '
+    'GT GW GY HK HN HR HT HU ID IE IL IN IQ IS IT JM JO JP KE KG KH KI KM KN KR KW KZ LA LB LC LI LK '
+    'LR LS LT LU LV LY MA MC MD ME MG MH MK ML MN MO MR MT MU MV MW MX MY MZ NA NE NG NI NL NO NP NR '
+    'NZ OM PA PE PG PH PK PL PS PT PW PY QA RO RS RW SA SB SC SE SG SI SK SL SM SN SR ST SV SZ TD TG '
+    'TH TJ TL TN TO TR TT TV TW TZ UA UG US UY UZ VC VE VN VU WS XK ZA ZM ZW'
+).split()
+
+
+def synthetic_fixtures(size=500, seed=0):
+    """Generate a reproducible catalog of tracks and audio features shaped like Spotify's"""
+    rng = random.Random(seed)
+    tracks = {}
+    audio_features = {}
+    for i in range(size):
+        track_id = hashlib.md5(f"{seed}:{i}".encode()).hexdigest()[:22]
+        artist = ARTISTS[i % len(ARTISTS)]
+        artist_id = hashlib.md5(artist.encode()).hexdigest()[:22]
+        album_id = hashlib.md5(f"{seed}:{i}:album".encode()).hexdigest()[:22]
+        name = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+        markets = [market for market in MARKETS if rng.random() < 0.95]
+        artists = [{
+            'id': artist_id,
+            'name': artist,
+            'type': 'artist',
+            'uri': f"spotify:artist:{artist_id}",
+            'href': f"https://api.spotify.com/v1/artists/{artist_id}",
+            'external_urls': {'spotify': f"https://open.spotify.com/artist/{artist_id}"},
+        }]
+        tracks[track_id] = {
+            'id': track_id,
+            'name': name,
+            'type': 'track',
+            'uri': f"spotify:track:{track_id}",
+            'href': f"https://api.spotify.com/v1/tracks/{track_id}",
+            'artists': artists,
+            'album': {
+                'id': album_id,
+                'name': f"{rng.choice(WORDS)} {rng.choice(WORDS)}",
+                'album_type': 'album',
+                'type': 'album',
+                'uri': f"spotify:album:{album_id}",
+                'href': f"https://api.spotify.com/v1/albums/{album_id}",
+                'artists': artists,
+                'available_markets': markets,
+                'images': [
+                    {'url': f"https://i.scdn.co/image/{album_id}{size}", 'height': size, 'width': size}
+                    for size in (640, 300, 64)
+                ],
+                'release_date': f"{rng.randint(1970, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                'release_date_precision': 'day',
+                'total_tracks': rng.randint(1, 20),
+                'external_urls': {'spotify': f"https://open.spotify.com/album/{album_id}"},
+            },
+            'available_markets': markets,
+            'disc_number': 1,
+            'track_number': rng.randint(1, 12),
+            'duration_ms': rng.randint(120000, 360000),
+            'explicit': rng.random() < 0.2,
+            'is_local': False,
+            'popularity': rng.randint(0, 100),
+            'preview_url': None,
+            'external_ids': {'isrc': f"US{track_id[:10].upper()}"},
+            'external_urls': {'spotify': f"https://open.spotify.com/track/{track_id}"},
+        }
+        audio_features[track_id] = {
+            'id': track_id,
+            'tempo': round(rng.uniform(60, 190), 3),
+            'energy': round(rng.random(), 3),
+            'valence': round(rng.random(), 3),
+            'danceability': round(rng.random(), 3),
+            'acousticness': round(rng.random(), 3),
+            'instrumentalness': round(rng.random() ** 3, 3),
+            'speechiness': round(rng.random() ** 2 / 2, 3),
+            'loudness': round(rng.uniform(-20, -2), 3),
+        }
+    return {'tracks': tracks, 'audio_features': audio_features, 'searches': {}}
+
+
+def load_fixtures(path=None, size=500, seed=0):
+    """Load a recorded fixture file, or generate a synthetic catalog when no path is given"""
+    if not path:
+        return synthetic_fixtures(size, seed)
+    with open(path) as f:
+        fixtures = json.load(f)
+    fixtures.setdefault('audio_features', {})
+    fixtures.setdefault('searches', {})
+    return fixtures
+
+
+def save_fixtures(fixtures, path):
+    with open(path, 'w') as f:
+        json.dump(fixtures, f)
@@ -0,0 +1,139 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DESCRIPTIONS = [
+    'I love the upbeat energy and catchy chorus',
+    'sad and slow, perfect for a rainy night',
+    'dreamy synths and a laid back groove',
+    'the guitar riff is amazing and makes me want to dance',
+    'calm acoustic vibe for studying',
+    'dark, moody and a little haunting',
+]
+
+
+SERIALIZE_TIMING = re.compile(r'serialize;dur=([0-9.]+)')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+def search_requests(fixtures, count, seed=0):
+    """(method, path, body) for /api/search with queries built from catalog names"""
+    rng = random.Random(seed)
+    tracks = list(fixtures['tracks'].values())
+    calls = []
+    for _ in range(count):
+        track = rng.choice(tracks)
+        query = rng.choice([track['name'], f"{track['name']} {track['artists'][0]['name']}", track['artists'][0]['name']])
+        calls.append(('GET', '/api/search', {'q': query}))
+    return calls
+
+
+def recommendation_requests(fixtures, count, seeds=20, path='/api/ai-recommendations', seed=0, fields=None):
+    """(method, path, body) for the recommendation endpoints over a fixed pool of seed tracks"""
+    if fields:
+        path = f"{path}?fields={fields}"
+    rng = random.Random(seed)
+    pool = rng.sample(sorted(fixtures['tracks']), min(seeds, len(fixtures['tracks'])))
+    return [
+        ('POST', path, {'trackId': rng.choice(pool), 'userDescription': rng.choice(DESCRIPTIONS)})
+        for _ in range(count)
+    ]
+
+
+def run_load(base_url, calls, concurrency=8, timeout=60, accept_encoding='gzip'):
+    """Send calls from concurrency threads and return (results, elapsed seconds).
+
+    Each result is (seconds, status, bytes on the wire, decoded body bytes, server-side
+    serialization ms or None when the server sends no Server-Timing).
+    """
+    local = threading.local()
+    results = []
+    lock = threading.Lock()
+
+    def send(call):
+        method, path, body = call
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.headers['Accept-Encoding'] = accept_encoding
+        started = time.perf_counter()
+        wire_bytes, body_bytes, serialize_ms = 0, 0, None
+        try:
+            if method == 'GET':
+                response = session.get(base_url + path, params=body, timeout=timeout)
+            else:
+                response = session.post(base_url + path, json=body, timeout=timeout)
+            # Read the whole body so streamed responses are timed to their last event
+            body_bytes = len(response.content)
+            status = response.status_code
+            # Content-Length is the compressed size; streamed responses have none
+            wire_bytes = int(response.headers.get('Content-Length', body_bytes))
+            timing = SERIALIZE_TIMING.search(response.headers.get('Server-Timing', ''))
+            serialize_ms = float(timing.group(1)) if timing else None
+        except requests.RequestException:
+            status = 0
+        elapsed = time.perf_counter() - started
+        with lock:
+            results.append((elapsed, status, wire_bytes, body_bytes, serialize_ms))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, calls))
+    return results, time.perf_counter() - started
+
+
+def summarize(name, results, elapsed, upstream=None):
+    latencies = sorted(result[0] * 1000 for result in results)
+    errors = sum(1 for result in results if result[1] != 200)
+    serialize = [result[4] for result in results if result[4] is not None]
+    summary = {
+        'endpoint': name,
+        'requests': len(results),
+        'errors': errors,
+        'rps': len(results) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1] if latencies else 0.0,
+        'wire_bytes': sum(result[2] for result in results) / len(results) if results else 0.0,
+        'body_bytes': sum(result[3] for result in results) / len(results) if results else 0.0,
+        'serialize_ms': sum(serialize) / len(serialize) if serialize else None,
+    }
+    if upstream is not None:
+        summary['upstream_calls'] = upstream['total']
+        summary['upstream_per_request'] = upstream['total'] / len(results) if results else 0.0
+        summary['upstream'] = upstream['calls']
+        summary['throttled'] = sum(upstream['throttled'].values())
+    return summary
+
+
+def print_report(summaries):
+    header = (
+        f"{'endpoint':<34}{'reqs':>6}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'upstream/req':>14}{'429s':>6}{'wire KB':>9}{'body KB':>9}{'ser ms':>9}"
+    )
+    print(header)
+    print('-' * len(header))
+    for s in summaries:
+        print(
+            f"{s['endpoint']:<34}{s['requests']:>6}{s['errors']:>6}{s['rps']:>9.1f}"
+            f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+            f"{s.get('upstream_per_request', 0):>14.2f}{s.get('throttled', 0):>6}"
+            f"{s['wire_bytes'] / 1024:>9.1f}{s['body_bytes'] / 1024:>9.1f}"
+            f"{s['serialize_ms'] if s['serialize_ms'] is not None else float('nan'):>9.3f}"
+        )
+    for s in summaries:
+        if s.get('upstream'):
+            calls = ', '.join(f"{name}={count}" for name, count in sorted(s['upstream'].items()))
+            print(f"  {s['endpoint']} upstream: {calls}")
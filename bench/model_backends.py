@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from models import BACKENDS, load_sentiment_analyzer, load_text_generator
+
+SENTIMENT_TEXTS = [
+    'I love the upbeat energy and catchy chorus',
+    'sad and slow, perfect for a rainy night',
+    'dreamy synths and a laid back groove',
+    'the guitar riff is amazing and makes me want to dance',
+    'this song is boring and repetitive',
+    'dark, moody and a little haunting',
+    'Midnight City M83',
+    'Motion Sickness Phoebe Bridgers',
+    'Get Lucky Daft Punk',
+    'Creep Radiohead',
+    'Happier Than Ever Billie Eilish',
+    'The Less I Know The Better Tame Impala',
+] * 4
+
+GENERATION_PROMPTS = [
+    f"{song} is similar to Midnight City by M83 because"
+    for song in ['Kids by MGMT', 'Electric Feel by MGMT', 'Digital Love by Daft Punk', 'Oblivion by Grimes']
+] * 2
+
+
+def current_rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(backend, threads, repeats):
+    """Load both models on one backend and time them; runs in its own process for a clean RSS"""
+    baseline_rss = current_rss_mb()
+
+    started = time.perf_counter()
+    sentiment_analyzer = load_sentiment_analyzer(backend, threads)
+    text_generator = load_text_generator(backend, threads)
+    load_seconds = time.perf_counter() - started
+
+    sentiments = sentiment_analyzer(SENTIMENT_TEXTS, batch_size=32, truncation=True)
+    generated = text_generator(GENERATION_PROMPTS, batch_size=8, max_new_tokens=20, do_sample=False)
+
+    sentiment_times = []
+    generation_times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        sentiment_analyzer(SENTIMENT_TEXTS, batch_size=32, truncation=True)
+        sentiment_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        text_generator(GENERATION_PROMPTS, batch_size=8, max_new_tokens=20, do_sample=False)
+        generation_times.append(time.perf_counter() - started)
+
+    return {
+        'backend': backend,
+        'load_seconds': load_seconds,
+        'sentiment_ms': 1000 * min(sentiment_times),
+        'generation_ms': 1000 * min(generation_times),
+        'rss_mb': current_rss_mb() - baseline_rss,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'sentiments': sentiments,
+        'generated': [output[0]['generated_text'] for output in generated],
+    }
+
+
+def compare(reference, result):
+    """How closely a backend reproduces the fp32 outputs"""
+    labels = [
+        a['label'] == b['label']
+        for a, b in zip(reference['sentiments'], result['sentiments'])
+    ]
+    score_drift = max(
+        abs(a['score'] - b['score'])
+        for a, b in zip(reference['sentiments'], result['sentiments'])
+    )
+    same_text = [a == b for a, b in zip(reference['generated'], result['generated'])]
+    return {
+        'label_agreement': sum(labels) / len(labels),
+        'max_score_drift': score_drift,
+        'generation_match': sum(same_text) / len(same_text),
+    }
+
+
+def run_backend(backend, threads, repeats):
+    """Measure one backend in a fresh interpreter so models and RSS do not mix"""
+    output = subprocess.run(
+        [sys.executable, '-m', 'bench.model_backends', '--worker', backend,
+         '--threads', str(threads), '--repeats', str(repeats)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare model backends against fp32 PyTorch')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('INFERENCE_THREADS', '0')))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help='fail when a backend agrees with fp32 on fewer sentiment labels than this')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.threads, args.repeats)))
+        sys.exit(0)
+
+    backends = ['pytorch'] + [name for name in args.backends.split(',') if name != 'pytorch']
+    results = [run_backend(backend, args.threads, args.repeats) for backend in backends]
+    reference = results[0]
+
+    print(f"{'backend':<10}{'load s':>8}{'sentiment ms':>14}{'generation ms':>15}{'RSS MB':>9}{'labels':>8}{'score drift':>13}{'same text':>11}")
+    failed = False
+    for result in results:
+        accuracy = compare(reference, result)
+        failed = failed or accuracy['label_agreement'] < args.min_agreement
+        print(
+            f"{result['backend']:<10}{result['load_seconds']:>8.1f}{result['sentiment_ms']:>14.1f}"
+            f"{result['generation_ms']:>15.1f}{result['rss_mb']:>9.0f}{accuracy['label_agreement']:>8.0%}"
+            f"{accuracy['max_score_drift']:>13.3f}{accuracy['generation_match']:>11.0%}"
+        )
+    sys.exit(1 if failed else 0)
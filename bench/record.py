@@ -0,0 +1,50 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+from bench.fixtures import save_fixtures
+from spotify_client import SpotifyClient, TokenManager
+
+
+def record(queries, client, token, limit=10):
+    """Run searches against Spotify and capture their tracks and audio features as fixtures"""
+    fixtures = {'tracks': {}, 'audio_features': {}, 'searches': {}}
+    for query in queries:
+        response = client.get('/search', token, params={'q': query, 'type': 'track', 'limit': limit, 'market': 'US'})
+        if response.status_code != 200:
+            print(f"Search failed for {query!r}: {response.status_code}")
+            continue
+        items = response.json()['tracks']['items']
+        fixtures['searches'][query] = [track['id'] for track in items]
+        for track in items:
+            fixtures['tracks'][track['id']] = track
+
+    ids = list(fixtures['tracks'])
+    for start in range(0, len(ids), 100):
+        response = client.get('/audio-features', token, params={'ids': ','.join(ids[start:start + 100])})
+        if response.status_code != 200:
+            print(f"Audio features failed: {response.status_code}")
+            continue
+        for features in response.json().get('audio_features') or []:
+            if features:
+                fixtures['audio_features'][features['id']] = features
+    return fixtures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record Spotify responses as benchmark fixtures')
+    parser.add_argument('queries', nargs='+', help='search queries to record')
+    parser.add_argument('--limit', type=int, default=10, help='tracks per search')
+    parser.add_argument('--output', default='bench_fixtures.json')
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = SpotifyClient()
+    token = TokenManager(os.getenv('SPOTIFY_CLIENT_ID'), os.getenv('SPOTIFY_CLIENT_SECRET'), http=client).get_token()
+    if not token:
+        raise SystemExit('Could not get a Spotify token; check SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET')
+
+    fixtures = record(args.queries, client, token, args.limit)
+    save_fixtures(fixtures, args.output)
+    print(f"Recorded {len(fixtures['searches'])} searches and {len(fixtures['tracks'])} tracks to {args.output}")
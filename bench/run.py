@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import threading
+
+import requests
+
+from bench import load
+from bench.fake_spotify import add_arguments, from_arguments
+
+SCENARIOS = {
+    'search': lambda fixtures, args: load.search_requests(fixtures, args.requests),
+    'recommendations': lambda fixtures, args: load.recommendation_requests(
+        fixtures, args.requests, args.seeds, fields=args.fields
+    ),
+    'stream': lambda fixtures, args: load.recommendation_requests(
+        fixtures, args.requests, args.seeds, path='/api/ai-recommendations/stream', fields=args.fields
+    ),
+}
+
+
+def start_server(fake, args):
+    """Import server.py against the fake API and stub models and serve it on a local port"""
+    os.environ.update({
+        'SPOTIFY_CLIENT_ID': 'bench',
+        'SPOTIFY_CLIENT_SECRET': 'bench',
+        'SPOTIFY_API_URL': fake.api_url,
+        'SPOTIFY_TOKEN_URL': fake.token_url,
+        'FEATURE_INDEX_PATH': '',
+        'TRACK_STORE_PATH': os.getenv('TRACK_STORE_PATH', ''),
+        'PRECOMPUTED_PATH': os.getenv('PRECOMPUTED_PATH', ''),
+        'PRELOAD_MODELS': '',
+        # Server-Timing carries the serialization time the report shows
+        'SERVER_TIMING': os.getenv('SERVER_TIMING', 'true'),
+    })
+    if not args.keep_caches:
+        # Measure the pipeline itself rather than cache hits on repeated seeds
+        os.environ.update({'RESPONSE_CACHE_SIZE': '0', 'RESULT_CACHE_TTL': '0', 'RESULT_CACHE_STALE_TTL': '0'})
+
+    from models import registry
+    from bench.stub_models import install
+
+    scale = args.model_latency_scale
+    install(registry, (0.01 * scale, 0.002 * scale), (0.02 * scale, 0.001 * scale), (0.005 * scale, 0.0005 * scale))
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, name='bench-server', daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_port}", httpd
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test for the song-match API')
+    parser.add_argument('--endpoints', default='search,recommendations', help=f"comma separated: {', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seeds', type=int, default=20, help='distinct seed tracks for recommendation requests')
+    parser.add_argument('--target', help='base URL of an already running server (default: start server.py in-process)')
+    parser.add_argument('--fake-port', type=int, default=0, help='port for the fake Spotify API (use a fixed one with --target)')
+    parser.add_argument('--keep-caches', action='store_true', help='leave the response and result caches enabled')
+    parser.add_argument('--model-latency-scale', type=float, default=1.0, help='multiply the stub models\' delays')
+    parser.add_argument('--fields', help="fields= for recommendation requests, e.g. 'full' for whole Spotify objects")
+    parser.add_argument('--accept-encoding', default='gzip', help="Accept-Encoding to send ('identity' for none)")
+    parser.add_argument('--json', help='also write the results to this file')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = from_arguments(args, port=args.fake_port).start()
+    httpd = None
+    if args.target:
+        base_url = args.target.rstrip('/')
+        print(f"Fake Spotify API at {fake.api_url}; start the target with "
+              f"SPOTIFY_API_URL={fake.api_url} SPOTIFY_TOKEN_URL={fake.token_url}")
+    else:
+        base_url, httpd = start_server(fake, args)
+    requests.post(f"{base_url}/api/warmup", timeout=600)
+
+    summaries = []
+    for name in args.endpoints.split(','):
+        calls = SCENARIOS[name.strip()](fake.fixtures, args)
+        fake.reset()
+        results, elapsed = load.run_load(base_url, calls, args.concurrency, accept_encoding=args.accept_encoding)
+        summaries.append(load.summarize(calls[0][1].split('?')[0], results, elapsed, fake.stats()))
+
+    load.print_report(summaries)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
+
+    if httpd:
+        httpd.shutdown()
+    fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import hashlib
+import time
+
+import numpy as np
+
+POSITIVE_WORDS = {'happy', 'love', 'upbeat', 'bright', 'dance', 'fun', 'golden', 'summer', 'sunny', 'great', 'energetic'}
+NEGATIVE_WORDS = {'sad', 'dark', 'lonely', 'slow', 'ghost', 'melancholic', 'static', 'cold', 'rain', 'hate'}
+
+
+class StubSentimentAnalyzer:
+    """Answers like the transformers sentiment pipeline, from a word list, after a fixed delay.
+
+    Each call costs batch_latency plus item_latency per text, roughly how a batched forward
+    pass on CPU scales.
+    """
+
+    def __init__(self, batch_latency=0.01, item_latency=0.002):
+        self.batch_latency = batch_latency
+        self.item_latency = item_latency
+        self.calls = 0
+        self.items = 0
+
+    def __call__(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        self.calls += 1
+        self.items += len(texts)
+        time.sleep(self.batch_latency + self.item_latency * len(texts))
+
+        results = []
+        for text in texts:
+            words = set(text.lower().split())
+            score = len(words & POSITIVE_WORDS) - len(words & NEGATIVE_WORDS)
+            if score == 0:
+                # Stable coin flip so unknown texts do not all share one label
+                score = 1 if hashlib.md5(text.encode()).digest()[0] % 2 else -1
+            label = 'POSITIVE' if score > 0 else 'NEGATIVE'
+            results.append({'label': label, 'score': 0.9})
+        return results
+
+
+class StubTextGenerator:
+    """Answers like the transformers text-generation pipeline with canned continuations.
+
+    Costs batch_latency plus token_latency per new token for the whole batch, as a padded
+    batch decodes all prompts together.
+    """
+
+    CONTINUATION = " they share a similar mood, tempo and melodic feel that fans of both will enjoy."
+
+    def __init__(self, batch_latency=0.02, token_latency=0.001):
+        self.batch_latency = batch_latency
+        self.token_latency = token_latency
+        self.calls = 0
+        self.items = 0
+
+    def __call__(self, prompts, max_new_tokens=50, num_return_sequences=1, return_full_text=True, **kwargs):
+        single = isinstance(prompts, str)
+        prompts = [prompts] if single else list(prompts)
+        self.calls += 1
+        self.items += len(prompts)
+        time.sleep(self.batch_latency + self.token_latency * max_new_tokens)
+
+        # Like the pipeline, return_full_text=False leaves the prompt out of generated_text
+        outputs = [
+            [{'generated_text': (prompt if return_full_text else '') + self.CONTINUATION}] * num_return_sequences
+            for prompt in prompts
+        ]
+        return outputs[0] if single else outputs
+
+
+class StubTextEmbedder:
+    """Answers like models.TextEmbedder with hashed bag-of-words vectors, so texts sharing
+    words come out similar. Costs batch_latency plus item_latency per text.
+    """
+
+    def __init__(self, batch_latency=0.005, item_latency=0.0005, dim=64):
+        self.batch_latency = batch_latency
+        self.item_latency = item_latency
+        self.dim = dim
+        self.calls = 0
+        self.items = 0
+
+    def __call__(self, texts, batch_size=64):
+        self.calls += 1
+        self.items += len(texts)
+        time.sleep(self.batch_latency + self.item_latency * len(texts))
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, hashlib.md5(word.encode()).digest()[0] % self.dim] += 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+
+def install(registry, sentiment_latency=(0.01, 0.002), generation_latency=(0.02, 0.001), embedding_latency=(0.005, 0.0005)):
+    """Replace the registry's model loaders with stubs; call before any model is loaded"""
+    sentiment = StubSentimentAnalyzer(*sentiment_latency)
+    generator = StubTextGenerator(*generation_latency)
+    embedder = StubTextEmbedder(*embedding_latency)
+    registry.register('sentiment_analyzer', lambda: sentiment)
+    registry.register('text_generator', lambda: generator)
+    registry.register('text_embedder', lambda: embedder)
+    return {'sentiment_analyzer': sentiment, 'text_generator': generator, 'text_embedder': embedder}
@@ -0,0 +1,31 @@
+import time
+
+
+class Budget:
+    """Time a single request may spend, and the pipeline steps it skipped to stay within it.
+
+    Each stage asks allows(cost) before doing something expensive and falls back to a cheaper
+    strategy, recording it with skip(), when the remaining time would not cover it.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        self.skipped = []
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def allows(self, seconds):
+        return self.remaining() > seconds
+
+    def until(self, reserve):
+        """A time.monotonic() deadline that still leaves reserve seconds of the budget"""
+        return self.deadline - reserve
+
+    def skip(self, step):
+        if step not in self.skipped:
+            self.skipped.append(step)
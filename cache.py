@@ -0,0 +1,246 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from connection import ProcessConnection
+
+# Seconds each class of Spotify response stays fresh
+DEFAULT_TTLS = {
+    'audio_features': 30 * 24 * 3600,  # never changes for a given track
+    'track': 24 * 3600,
+    'search': 3600,
+}
+
+
+class MemoryBackend:
+    """Bounded in-process LRU store"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """On-disk LRU store that survives restarts.
+
+    Hits record their access time in memory; the times reach the table with the next write, or
+    once TOUCH_EVERY of them pile up, so a read never costs a write transaction of its own.
+    """
+
+    PRUNE_EVERY = 100
+    TOUCH_EVERY = 100
+
+    def __init__(self, path='spotify_cache.db', max_entries=100000):
+        self.max_entries = max_entries
+        self._db = ProcessConnection(
+            path,
+            'PRAGMA journal_mode=WAL',
+            'PRAGMA synchronous=NORMAL',
+            'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)',
+            'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)',
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+        # key -> last hit time not yet written to accessed_at
+        self._touched = {}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.get().execute(
+                'SELECT value, expires_at FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            # Expired rows are left for _prune to delete
+            if row is None or row[1] < now:
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.TOUCH_EVERY:
+                self._flush_touched()
+                self._db.get().commit()
+            return row[0]
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            conn = self._db.get()
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, value, now + ttl, now)
+            )
+            self._touched.pop(key, None)
+            self._flush_touched()
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(now)
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._db.get()
+            conn.execute('DELETE FROM cache')
+            conn.commit()
+            self._touched.clear()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.get().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def _flush_touched(self):
+        if self._touched:
+            self._db.get().executemany(
+                'UPDATE cache SET accessed_at = ? WHERE key = ?',
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _prune(self, now):
+        conn = self._db.get()
+        conn.execute('DELETE FROM cache WHERE expires_at < ?', (now,))
+        conn.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+
+class ResponseCache:
+    """JSON response cache with a TTL per endpoint class and hit/miss counters"""
+
+    def __init__(self, backend=None, ttls=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.hits = {}
+        self.misses = {}
+        # Optional callback(endpoint_class, hit) after every lookup
+        self.on_lookup = None
+
+    def get(self, endpoint_class, key):
+        # Values are stored serialized so callers can mutate what they get back
+        raw = self.backend.get(f"{endpoint_class}:{key}")
+        if self.on_lookup is not None:
+            self.on_lookup(endpoint_class, raw is not None)
+        if raw is None:
+            self.misses[endpoint_class] = self.misses.get(endpoint_class, 0) + 1
+            return None
+        self.hits[endpoint_class] = self.hits.get(endpoint_class, 0) + 1
+        return json.loads(raw)
+
+    def set(self, endpoint_class, key, value):
+        ttl = self.ttls.get(endpoint_class, 0)
+        if ttl <= 0:
+            return
+        self.backend.set(f"{endpoint_class}:{key}", json.dumps(value), ttl)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        classes = sorted(set(self.hits) | set(self.misses))
+        return {
+            'entries': len(self.backend),
+            'classes': {
+                name: {'hits': self.hits.get(name, 0), 'misses': self.misses.get(name, 0)}
+                for name in classes
+            },
+        }
+
+
+def create_response_cache(backend='memory', path='spotify_cache.db', max_entries=10000):
+    """Build a ResponseCache from config values"""
+    if backend == 'sqlite':
+        return ResponseCache(SQLiteBackend(path, max_entries))
+    return ResponseCache(MemoryBackend(max_entries))
+
+
+class ResultCache:
+    """TTL cache for whole computed results that can serve stale entries while refreshing them"""
+
+    def __init__(self, backend=None, ttl=600, stale_ttl=3600):
+        self.backend = backend if backend is not None else MemoryBackend(2000)
+        # Entries are fresh for ttl seconds, then served stale for up to stale_ttl more
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def get(self, key):
+        """Return (value, is_stale), or (None, False) on a miss"""
+        raw = self.backend.get(key)
+        if raw is None:
+            self.misses += 1
+            return None, False
+        entry = json.loads(raw)
+        if entry['fresh_until'] >= time.time():
+            self.hits += 1
+            return entry['value'], False
+        self.stale_hits += 1
+        return entry['value'], True
+
+    def set(self, key, value):
+        entry = {'value': value, 'fresh_until': time.time() + self.ttl}
+        self.backend.set(key, json.dumps(entry), self.ttl + self.stale_ttl)
+
+    def revalidate(self, key, compute):
+        """Recompute a stale entry in the background; only one refresh per key runs at a time"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                value = compute()
+                if value:
+                    self.set(key, value)
+                    self.refreshes += 1
+            except Exception as e:
+                print(f"Result refresh error: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name='result-cache-refresh', daemon=True).start()
+
+    def stats(self):
+        return {
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+        }
@@ -0,0 +1,28 @@
+import os
+import sqlite3
+
+
+class ProcessConnection:
+    """A sqlite3 connection that each process opens for itself on first use.
+
+    A SQLite connection must not be used across fork(). Under gunicorn --preload the master
+    imports server.py, which builds the SQLite-backed stores, before it forks the workers; each
+    worker then opens its own connection here instead of using the master's.
+    """
+
+    def __init__(self, path, *statements):
+        self.path = path
+        # Run on every new connection: pragmas and CREATE ... IF NOT EXISTS schema
+        self.statements = statements
+        self._conn = None
+        self._pid = None
+
+    def get(self):
+        """This process's connection; callers serialize their use of it with their own lock"""
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            for statement in self.statements:
+                conn.execute(statement)
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
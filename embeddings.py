@@ -0,0 +1,94 @@
+import threading
+
+import numpy as np
+
+
+def track_text(track):
+    """What a track is matched on: title, artists, album and any artist genres Spotify included"""
+    artists = track.get('artists') or []
+    parts = [track.get('name', '')]
+    parts += [artist.get('name', '') for artist in artists]
+    parts.append((track.get('album') or {}).get('name') or '')
+    parts += [genre for artist in artists for genre in artist.get('genres') or []]
+    return ' '.join(part for part in parts if part)
+
+
+class EmbeddingCache:
+    """Track embeddings in one float32 matrix, so a track is only ever encoded once.
+
+    Callers encode what lookup() reports missing, normalized, and hand the vectors to store().
+    Rows are reused oldest first once max_tracks tracks are stored.
+    """
+
+    def __init__(self, max_tracks=50000):
+        self.max_tracks = max_tracks
+        self._matrix = None
+        self._rows = {}
+        self._ids = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def lookup(self, tracks):
+        """({id: vector} for the stored tracks, [each track with no stored vector, once])
+
+        The vectors are copies, so they stay valid when their rows are reused.
+        """
+        with self._lock:
+            vectors = {
+                track['id']: self._matrix[self._rows[track['id']]].copy()
+                for track in tracks if track['id'] in self._rows
+            }
+        missing = list({track['id']: track for track in tracks if track['id'] not in vectors}.values())
+        self.hits += len(tracks) - len(missing)
+        self.misses += len(missing)
+        return vectors, missing
+
+    def store(self, tracks, encoded):
+        """Store one encoded vector per track; returns them as {id: vector}"""
+        encoded = np.asarray(encoded, dtype=np.float32)
+        with self._lock:
+            for track, vector in zip(tracks, encoded):
+                self._store(track['id'], vector)
+        return {track['id']: vector for track, vector in zip(tracks, encoded)}
+
+    def stats(self):
+        return {
+            'tracks': len(self._rows),
+            'bytes': self._matrix.nbytes if self._matrix is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def _store(self, track_id, vector):
+        if track_id in self._rows or self.max_tracks <= 0:
+            return
+        if self._matrix is None:
+            self._matrix = np.zeros((min(1024, self.max_tracks), len(vector)), dtype=np.float32)
+        elif self._next >= len(self._matrix) and len(self._matrix) < self.max_tracks:
+            # Grow by doubling up to max_tracks rows
+            grown = np.zeros((min(2 * len(self._matrix), self.max_tracks), self._matrix.shape[1]), dtype=np.float32)
+            grown[:len(self._matrix)] = self._matrix
+            self._matrix = grown
+
+        row = self._next % self.max_tracks
+        if row < len(self._ids):
+            del self._rows[self._ids[row]]
+            self._ids[row] = track_id
+        else:
+            self._ids.append(track_id)
+        self._matrix[row] = vector
+        self._rows[track_id] = row
+        self._next += 1
+
+
+def cosine_similarities(query, tracks, vectors):
+    """Cosine similarity of a normalized query vector to each track, given {id: vector} for all of them"""
+    if not tracks:
+        return np.zeros(0, dtype=np.float32)
+    return np.stack([vectors[track['id']] for track in tracks]) @ np.asarray(query, dtype=np.float32)
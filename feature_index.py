@@ -0,0 +1,393 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# feature: (low, high) used to scale every column into roughly 0..1
+FEATURE_RANGES = {
+    'tempo': (40.0, 220.0),
+    'energy': (0.0, 1.0),
+    'valence': (0.0, 1.0),
+    'danceability': (0.0, 1.0),
+    'acousticness': (0.0, 1.0),
+    'instrumentalness': (0.0, 1.0),
+    'speechiness': (0.0, 1.0),
+    'loudness': (-40.0, 0.0),
+}
+
+FEATURE_NAMES = list(FEATURE_RANGES)
+FEATURE_LOW = np.array([FEATURE_RANGES[name][0] for name in FEATURE_NAMES], dtype=np.float32)
+FEATURE_SPAN = np.array([FEATURE_RANGES[name][1] - FEATURE_RANGES[name][0] for name in FEATURE_NAMES], dtype=np.float32)
+
+# Tempo, energy and valence drive similarity the most, as in the scorer
+DEFAULT_WEIGHTS = {'tempo': 2.0, 'energy': 1.5, 'valence': 1.5, 'danceability': 1.0}
+
+
+def normalize(features):
+    """Scale one audio-features dict into a float32 vector"""
+    values = np.array(
+        [features.get(name) if features.get(name) is not None else (low + high) / 2
+         for name, (low, high) in FEATURE_RANGES.items()],
+        dtype=np.float32
+    )
+    return np.clip((values - FEATURE_LOW) / FEATURE_SPAN, 0.0, 1.0)
+
+
+class FeatureIndex:
+    """Nearest-neighbour index over every track whose audio features we have fetched.
+
+    Saved vectors live in a float32 .npy file that is memory-mapped on load. Tracks added
+    since then sit in a growing in-memory block that queries scan alongside the file, until
+    a background save folds them into it. Large indexes are partitioned into IVF cells so
+    a query only scans the cells of the saved vectors closest to the seed; the cells are
+    built in the background on first query and saved next to the vectors, so later loads
+    and saves only assign the rows that are new.
+
+    Processes sharing a path (serve.py's workers) save under a file lock, each merging its
+    new rows into whatever the others saved.
+    """
+
+    def __init__(self, path=None, weights=None, save_every=200, ivf_min_size=50000, nprobe=4):
+        self.path = path
+        self.save_every = save_every
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        weights = dict.fromkeys(FEATURE_NAMES, 1.0) | (weights or DEFAULT_WEIGHTS)
+        # Weighted distance == plain distance over vectors scaled by sqrt(weight)
+        self._scale = np.sqrt(np.array([weights[name] for name in FEATURE_NAMES], dtype=np.float32))
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._known = set()
+        # Saved rows, memory-mapped
+        self._ids = []
+        self._vectors = np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+        # Rows added since: the first len(self._added_ids) rows of self._added, which doubles as it fills
+        self._added_ids = []
+        self._added = np.empty((64, len(FEATURE_NAMES)), dtype=np.float32)
+        self._centroids = None
+        self._assignments = None
+        self._partitioning = False
+        # os.stat() identity of the file as this process last loaded or wrote it
+        self._file_stamp = None
+
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._ids) + len(self._added_ids)
+
+    def __contains__(self, track_id):
+        return track_id in self._known
+
+    def add(self, track_id, features):
+        """Add one track's features; audio features never change, so known tracks are skipped"""
+        self._add(track_id, features)
+        self._save_if_due()
+
+    def add_many(self, features_by_id):
+        for track_id, features in features_by_id.items():
+            self._add(track_id, features)
+        self._save_if_due()
+
+    def query(self, features, k=20, exclude=()):
+        """Return up to k (track_id, distance) pairs closest to the given audio features"""
+        with self._lock:
+            ids, vectors = self._ids, self._vectors
+            centroids, assignments = self._centroids, self._assignments
+            # Rows are only ever appended past this view; a save swaps in new lists and blocks
+            added_ids = self._added_ids
+            added = self._added[:len(added_ids)]
+        if not ids and not len(added):
+            return []
+
+        if centroids is None and len(vectors) >= self.ivf_min_size:
+            self._partition_in_background()
+
+        target = normalize(features) * self._scale
+        candidates = self._probe(target, centroids, assignments)
+        subset = vectors if candidates is None else vectors[candidates]
+        distances = np.concatenate([self._distances(subset, target), self._distances(added, target)])
+
+        wanted = min(len(distances), k + len(exclude))
+        nearest = np.argpartition(distances, wanted - 1)[:wanted]
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        results = []
+        for row in nearest:
+            if row >= len(subset):
+                track_id = added_ids[row - len(subset)]
+            else:
+                track_id = ids[row if candidates is None else candidates[row]]
+            if track_id in exclude:
+                continue
+            results.append((track_id, float(np.sqrt(distances[row]))))
+            if len(results) >= k:
+                break
+        return results
+
+    def build_partitions(self, cells=None, iterations=10):
+        """Cluster the saved vectors into IVF cells with a few rounds of k-means"""
+        with self._lock:
+            vectors, stamp = self._vectors, self._file_stamp
+        partitions = self._partition(vectors, cells, iterations)
+        if partitions is None:
+            return
+        with self._lock:
+            if self._vectors is not vectors:
+                return
+            self._centroids, self._assignments = partitions
+        if self.path:
+            with self._file_lock():
+                # Only if the vectors on disk are still the ones we clustered
+                if self._stamp() == stamp:
+                    self._write_partitions(*partitions)
+
+    def load(self):
+        if not os.path.isdir(self.path):
+            return
+        with self._file_lock(shared=True):
+            saved = self._read()
+            self._file_stamp = self._stamp()
+            partitions = self._read_partitions(len(saved[0])) if saved else None
+        if saved is None:
+            return
+        ids, vectors = saved
+        with self._lock:
+            self._ids = ids
+            self._vectors = vectors
+            self._known.update(ids)
+            if partitions is not None:
+                self._centroids, self._assignments = partitions
+
+    def save(self):
+        """Write every vector to disk and re-open the file memory-mapped"""
+        if not self.path:
+            return
+        with self._save_lock:
+            self._save()
+
+    def _add(self, track_id, features):
+        if not features or track_id in self._known:
+            return
+        vector = normalize(features) * self._scale
+        with self._lock:
+            if track_id in self._known:
+                return
+            self._known.add(track_id)
+            count = len(self._added_ids)
+            if count == len(self._added):
+                grown = np.empty((2 * len(self._added), len(FEATURE_NAMES)), dtype=np.float32)
+                grown[:count] = self._added
+                self._added = grown
+            self._added[count] = vector
+            self._added_ids.append(track_id)
+
+    def _save_if_due(self):
+        # Rewriting the file takes a while on a large index, so it never runs on the caller's thread
+        if not self.path or len(self._added_ids) < self.save_every:
+            return
+        if self._save_lock.acquire(blocking=False):
+            threading.Thread(target=self._save_in_background, name='feature-index-save', daemon=True).start()
+
+    def _partition_in_background(self):
+        with self._lock:
+            if self._partitioning:
+                return
+            self._partitioning = True
+        threading.Thread(target=self._partition_and_release, name='feature-index-partition', daemon=True).start()
+
+    def _partition_and_release(self):
+        try:
+            self.build_partitions()
+        except Exception as e:
+            print(f"Feature index partition error: {e}")
+        finally:
+            with self._lock:
+                self._partitioning = False
+
+    def _save_in_background(self):
+        try:
+            self._save()
+        except Exception as e:
+            print(f"Feature index save error: {e}")
+        finally:
+            self._save_lock.release()
+
+    def _save(self):
+        """Fold the added rows into the file; caller must hold self._save_lock"""
+        with self._lock:
+            saved = len(self._added_ids)
+            ids, base = self._ids, self._vectors
+            added_ids, added = self._added_ids[:saved], self._added[:saved]
+            partitions = (self._centroids, self._assignments) if self._centroids is not None else None
+
+        os.makedirs(self.path, exist_ok=True)
+        vectors_path, ids_path = self._files()
+        with self._file_lock():
+            # Another process saved since we last looked: build on its file, not our older copy
+            if self._stamp() != self._file_stamp:
+                on_disk = self._read()
+                if on_disk is not None:
+                    ids, base = on_disk
+                    partitions = self._read_partitions(len(ids))
+            known = set(ids)
+            keep = [row for row, track_id in enumerate(added_ids) if track_id not in known]
+
+            if keep or not os.path.exists(vectors_path):
+                ids = ids + [added_ids[row] for row in keep]
+                if partitions is not None:
+                    # Existing rows keep their cells; only the new ones are assigned
+                    centroids, assignments = partitions
+                    partitions = centroids, np.concatenate([assignments, self._nearest_centroid(added[keep], centroids)])
+                self._write(ids, base, added[keep])
+                if partitions is not None:
+                    self._write_partitions(*partitions)
+                else:
+                    self._remove_partitions()
+            vectors = np.load(vectors_path, mmap_mode='r')
+            self._file_stamp = self._stamp()
+        known.update(added_ids)
+
+        with self._lock:
+            self._ids = ids
+            self._vectors = vectors
+            self._known.update(ids)
+            # Rows added while the file was written stay in memory until the next save, unless
+            # another process saved them meanwhile
+            remaining = [row for row in range(saved, len(self._added_ids)) if self._added_ids[row] not in known]
+            block = np.empty((max(64, 2 * len(remaining)), len(FEATURE_NAMES)), dtype=np.float32)
+            block[:len(remaining)] = self._added[remaining]
+            self._added_ids = [self._added_ids[row] for row in remaining]
+            self._added = block
+            self._centroids, self._assignments = partitions if partitions is not None else (None, None)
+
+    def _write(self, ids, base, added):
+        """Write base's rows then added's to the index files; caller must hold the file lock"""
+        vectors_path, ids_path = self._files()
+        # Per-process temporary names, so concurrent writers never share one
+        vectors_tmp = f"{vectors_path}.{os.getpid()}.tmp.npy"
+        ids_tmp = f"{ids_path}.{os.getpid()}.tmp"
+        # Copies the memory-mapped rows over in chunks rather than loading them all at once
+        out = np.lib.format.open_memmap(vectors_tmp, mode='w+', dtype=np.float32, shape=(len(ids), len(FEATURE_NAMES)))
+        for start in range(0, len(base), 65536):
+            chunk = base[start:start + 65536]
+            out[start:start + len(chunk)] = chunk
+        out[len(base):] = added
+        out.flush()
+        del out
+        with open(ids_tmp, 'w') as f:
+            f.write('\n'.join(ids))
+        os.replace(vectors_tmp, vectors_path)
+        os.replace(ids_tmp, ids_path)
+
+    def _write_partitions(self, centroids, assignments):
+        """Save the IVF cells for the current vectors file; caller must hold the file lock"""
+        centroids_path, assignments_path = self._partition_files()
+        for path, array in ((centroids_path, centroids), (assignments_path, assignments)):
+            tmp = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp, array)
+            os.replace(tmp, path)
+
+    def _remove_partitions(self):
+        for path in self._partition_files():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _read_partitions(self, count):
+        """(centroids, assignments) saved for a vectors file of count rows, or None"""
+        centroids_path, assignments_path = self._partition_files()
+        if not os.path.exists(centroids_path) or not os.path.exists(assignments_path):
+            return None
+        centroids = np.load(centroids_path)
+        assignments = np.load(assignments_path, mmap_mode='r')
+        if len(assignments) != count:
+            return None
+        return centroids, assignments
+
+    def _read(self):
+        """(ids, memory-mapped vectors) from the index files, or None"""
+        vectors_path, ids_path = self._files()
+        if not os.path.exists(vectors_path) or not os.path.exists(ids_path):
+            return None
+        with open(ids_path) as f:
+            ids = f.read().split()
+        vectors = np.load(vectors_path, mmap_mode='r')
+        if len(ids) != len(vectors):
+            print(f"Feature index is inconsistent, ignoring {self.path}")
+            return None
+        return ids, vectors
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self._files()[0])
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        """Hold an flock on the index directory's lock file (a no-op without fcntl)"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, 'lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _distances(self, vectors, target):
+        diffs = vectors - target
+        return np.einsum('ij,ij->i', diffs, diffs)
+
+    def _partition(self, vectors, cells=None, iterations=10):
+        """(centroids, assignments) from a few rounds of k-means, or None below ivf_min_size"""
+        if len(vectors) < self.ivf_min_size:
+            return None
+        cells = cells or int(np.sqrt(len(vectors)))
+        # A few MB even for a large index, and k-means reads every row each round
+        vectors = np.asarray(vectors)
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(len(vectors), cells, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._nearest_centroid(vectors, centroids)
+            counts = np.bincount(assignments, minlength=cells)
+            filled = counts > 0
+            for column in range(vectors.shape[1]):
+                sums = np.bincount(assignments, weights=vectors[:, column], minlength=cells)
+                centroids[filled, column] = sums[filled] / counts[filled]
+        return centroids, self._nearest_centroid(vectors, centroids)
+
+    def _probe(self, target, centroids, assignments):
+        """Row numbers in the nprobe closest cells, or None to scan everything"""
+        if centroids is None:
+            return None
+        distances = ((centroids - target) ** 2).sum(axis=1)
+        cells = np.argsort(distances)[:self.nprobe]
+        return np.flatnonzero(np.isin(assignments, cells))
+
+    def _nearest_centroid(self, vectors, centroids):
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        # |x - c|^2 = |x|^2 - 2x.c + |c|^2, and |x|^2 is the same for every centroid
+        centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+        for start in range(0, len(vectors), 8192):
+            chunk = np.asarray(vectors[start:start + 8192])
+            distances = centroid_norms - 2.0 * (chunk @ centroids.T)
+            assignments[start:start + 8192] = distances.argmin(axis=1)
+        return assignments
+
+    def _files(self):
+        return os.path.join(self.path, 'vectors.npy'), os.path.join(self.path, 'ids.txt')
+
+    def _partition_files(self):
+        return os.path.join(self.path, 'centroids.npy'), os.path.join(self.path, 'assignments.npy')
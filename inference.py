@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError, wait
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a scheduler's queue cannot take more work"""
+
+
+class BatchScheduler:
+    """Collects inputs from many request threads and runs them through a model in batches.
+
+    A worker thread takes the oldest queued input, waits up to max_wait seconds for more
+    inputs with the same options to arrive (or until max_batch_size is reached), makes one
+    run_batch(inputs, options) call and resolves each caller's future with its own result.
+    Inputs whose futures were cancelled before their batch started are dropped unrun.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size=32, max_wait=0.01, max_queue=1024):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.longest_wait = 0.0
+
+    def submit(self, inputs, options=()):
+        """Queue inputs that share the same (hashable) options and return one future per input"""
+        futures = []
+        with self._condition:
+            if len(self._queue) + len(inputs) > self.max_queue:
+                self.rejected += len(inputs)
+                raise QueueFullError(f"{self.name} queue is full ({len(self._queue)} waiting)")
+            now = time.monotonic()
+            for item in inputs:
+                future = Future()
+                self._queue.append((item, options, future, now))
+                futures.append(future)
+            self._condition.notify()
+            # A worker started before a fork does not exist in the child, so check it is alive
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f'{self.name}-batcher', daemon=True)
+                self._worker.start()
+        return futures
+
+    def run(self, inputs, options=(), timeout=None):
+        """Submit inputs and block until all of their results are ready, at most timeout seconds
+        in total. On a timeout the inputs that have not started running are withdrawn.
+        """
+        futures = self.submit(inputs, options)
+        _, pending = wait(futures, timeout)
+        if pending:
+            for future in pending:
+                future.cancel()
+            raise TimeoutError(f"{self.name} results not ready after {timeout}s")
+        return [future.result() for future in futures]
+
+    def stats(self):
+        return {
+            'queue_depth': len(self._queue),
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0,
+            'largest_batch': self.largest_batch,
+            'avg_wait_ms': 1000 * self.total_wait / self.items if self.items else 0,
+            'longest_wait_ms': 1000 * self.longest_wait,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled,
+        }
+
+    def _run(self):
+        while True:
+            batch, options = self._next_batch()
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                results = self.run_batch([item for item, _, _, _ in batch], options)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} returned {len(results)} results for {len(batch)} inputs")
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, _, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+            waits = [started - enqueued for _, _, _, enqueued in batch]
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.total_wait += sum(waits)
+            self.longest_wait = max(self.longest_wait, max(waits))
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._drop_cancelled():
+                self._condition.wait()
+
+            options = self._queue[0][1]
+            deadline = self._queue[0][3] + self.max_wait
+            while self._matching(options) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = []
+            kept = deque()
+            while self._queue:
+                entry = self._queue.popleft()
+                if entry[1] == options and len(batch) < self.max_batch_size:
+                    # From here on the caller can no longer cancel it
+                    if entry[2].set_running_or_notify_cancel():
+                        batch.append(entry)
+                    else:
+                        self.cancelled += 1
+                else:
+                    kept.append(entry)
+            self._queue = kept
+            return batch, options
+
+    def _matching(self, options):
+        return sum(1 for entry in self._queue if entry[1] == options and not entry[2].cancelled())
+
+    def _drop_cancelled(self):
+        """Remove inputs whose callers gave up on them; returns the number left queued"""
+        queued = len(self._queue)
+        self._queue = deque(entry for entry in self._queue if not entry[2].cancelled())
+        self.cancelled += queued - len(self._queue)
+        return len(self._queue)
@@ -0,0 +1,173 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """Stage timings and counters collected while serving one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            total, calls = self.spans.get(name, (0.0, 0))
+            self.spans[name] = (total + seconds, calls + 1)
+
+    def add_count(self, name, value):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Render as a Server-Timing header value: one entry per stage, then the counters"""
+        with self._lock:
+            entries = [f"{name};dur={1000 * total:.3f}" for name, (total, _) in self.spans.items()]
+            entries += [f'{name};desc="{value}"' for name, value in self.counts.items()]
+        entries.append(f"total;dur={1000 * self.elapsed():.3f}")
+        return ', '.join(entries)
+
+
+class Metrics:
+    """Process-wide counters and latency histograms, exported in the Prometheus text format.
+
+    Counters and span timings also land on the current request's Trace, when one is active.
+    Components that keep their own stats() are exported as gauges through register_stats().
+    """
+
+    def __init__(self, namespace='songmatch', buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._stats = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_count('_'.join([name, *map(str, labels.values())]), value)
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def span(self, stage):
+        """Time a pipeline stage into stage_seconds and the current request's trace"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe('stage_seconds', seconds, stage=stage)
+            trace = current_trace.get()
+            if trace is not None:
+                trace.add_span(stage, seconds)
+
+    def start_trace(self):
+        trace = Trace()
+        current_trace.set(trace)
+        return trace
+
+    def trace(self):
+        return current_trace.get()
+
+    def register_stats(self, prefix, stats):
+        """Export the numbers in a component's stats() dict as gauges named after prefix"""
+        self._stats.append((prefix, stats))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{self.namespace}_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {value}")
+
+        for (name, labels), (buckets, total, count) in histograms:
+            metric = f"{self.namespace}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+
+        for prefix, stats in self._stats:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Metrics stats error for {prefix}: {e}")
+                continue
+            for name, labels, value in _flatten(f"{self.namespace}_{prefix}", values, ()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def in_context(fn):
+    """Wrap fn to run in a copy of the caller's context, so a worker thread sees its trace"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _flatten(name, values, labels):
+    """Yield (metric, labels, number) for a nested stats dict.
+
+    A dict whose values are all dicts is keyed by something like an endpoint class, so its
+    keys become a "kind" label instead of part of the metric name.
+    """
+    if isinstance(values, bool):
+        yield name, labels, int(values)
+    elif isinstance(values, (int, float)):
+        yield name, labels, values
+    elif isinstance(values, dict):
+        if values and all(isinstance(value, dict) for value in values.values()):
+            for key, value in values.items():
+                yield from _flatten(name, value, labels + (('kind', key),))
+        else:
+            for key, value in values.items():
+                yield from _flatten(f"{name}_{key}", value, labels)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+registry = Metrics()
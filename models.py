@@ -0,0 +1,262 @@
+import os
+import sys
+import threading
+
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+TEXT_GENERATION_MODEL = "EleutherAI/gpt-neo-125M"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# "pytorch" is the stock fp32 model, "int8" dynamically quantizes its Linear layers and
+# "onnx" exports it once to an ONNX Runtime graph (cached under ONNX_CACHE_DIR)
+BACKENDS = ('pytorch', 'int8', 'onnx')
+
+
+def inference_settings(backend=None, threads=None):
+    """Resolve the backend and intra-op thread count (0 = library default) from args or env"""
+    backend = backend or os.getenv('MODEL_BACKEND', 'pytorch')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if threads is None:
+        threads = int(os.getenv('INFERENCE_THREADS', '0'))
+    return backend, threads
+
+
+def load_model(task, model_name, backend=None, threads=None):
+    """Load model_name's weights for task ('sentiment-analysis', 'text-generation' or
+    'feature-extraction') on the selected inference backend"""
+    backend, threads = inference_settings(backend, threads)
+
+    if backend == 'onnx':
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForCausalLM, ORTModelForFeatureExtraction, ORTModelForSequenceClassification
+
+        model_class = {
+            'sentiment-analysis': ORTModelForSequenceClassification,
+            'text-generation': ORTModelForCausalLM,
+            'feature-extraction': ORTModelForFeatureExtraction,
+        }[task]
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        export_dir = os.path.join(os.getenv('ONNX_CACHE_DIR', 'onnx_models'), model_name.replace('/', '--'))
+        if os.path.isdir(export_dir):
+            model = model_class.from_pretrained(export_dir, session_options=options)
+        else:
+            model = model_class.from_pretrained(model_name, export=True, session_options=options)
+            model.save_pretrained(export_dir)
+    else:
+        import torch
+        from transformers import AutoModel, AutoModelForCausalLM, AutoModelForSequenceClassification
+
+        if threads:
+            torch.set_num_threads(threads)
+        model_class = {
+            'sentiment-analysis': AutoModelForSequenceClassification,
+            'text-generation': AutoModelForCausalLM,
+            'feature-extraction': AutoModel,
+        }[task]
+        model = model_class.from_pretrained(model_name)
+        model.eval()
+        if backend == 'int8':
+            # Weights stored as int8, activations quantized on the fly; no calibration data needed
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return model
+
+
+def load_pipeline(task, model_name, backend=None, threads=None, **kwargs):
+    """Build a transformers pipeline for task on the selected inference backend"""
+    from transformers import AutoTokenizer, pipeline
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = load_model(task, model_name, backend, threads)
+    return pipeline(task, model=model, tokenizer=tokenizer, **kwargs)
+
+
+def load_sentiment_analyzer(backend=None, threads=None):
+    return load_pipeline("sentiment-analysis", SENTIMENT_MODEL, backend, threads)
+
+
+def load_text_generator(backend=None, threads=None):
+    from transformers import set_seed
+
+    text_generator = load_pipeline(
+        "text-generation",
+        TEXT_GENERATION_MODEL,
+        backend,
+        threads,
+        pad_token_id=50256
+    )
+    # Batched generation needs a pad token and left padding so every prompt ends at the same position
+    text_generator.tokenizer.padding_side = 'left'
+    if text_generator.tokenizer.pad_token is None:
+        text_generator.tokenizer.pad_token = text_generator.tokenizer.eos_token
+
+    set_seed(42)
+    return text_generator
+
+
+class TextEmbedder:
+    """Sentence embeddings: mean-pooled token states, L2-normalized so a dot product is the cosine.
+
+    Called with a list of texts, returns a float32 (len(texts), dim) array.
+    """
+
+    def __init__(self, model, tokenizer, max_length=64):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+
+    def __call__(self, texts, batch_size=64):
+        import numpy as np
+        import torch
+
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                list(texts[start:start + batch_size]), padding=True, truncation=True,
+                max_length=self.max_length, return_tensors='pt'
+            )
+            with torch.no_grad():
+                states = self.model(**inputs).last_hidden_state
+            mask = inputs['attention_mask'].unsqueeze(-1).to(states.dtype)
+            pooled = (states * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            chunks.append(torch.nn.functional.normalize(pooled, dim=1).numpy().astype(np.float32))
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(chunks)
+
+
+def load_text_embedder(backend=None, threads=None):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+    return TextEmbedder(load_model('feature-extraction', EMBEDDING_MODEL, backend, threads), tokenizer)
+
+
+def required_models(description_matcher=None, result_cache_key=None):
+    """The models serving needs with these settings (default: from the environment), as groups
+    of which one model has to load.
+
+    The embedding matcher falls back to sentiment matching when the embedder cannot load, so
+    either will do; a sentiment-keyed result cache always needs the sentiment model.
+    """
+    description_matcher = description_matcher or os.getenv('DESCRIPTION_MATCHER', 'embedding')
+    result_cache_key = result_cache_key or os.getenv('RESULT_CACHE_KEY', 'text')
+    groups = [('text_generator',)]
+    if description_matcher == 'embedding':
+        groups.append(('text_embedder', 'sentiment_analyzer'))
+    else:
+        groups.append(('sentiment_analyzer',))
+    if result_cache_key == 'sentiment':
+        groups.append(('sentiment_analyzer',))
+    return groups
+
+
+class ModelRegistry:
+    """Loads each model once, on first use or on warm-up, from any thread"""
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+
+    def get(self, name, retry=False):
+        """Return the loaded model, or None if it failed to load.
+
+        A failed load is remembered, so callers do not retry it on every use; retry=True (as
+        warm_up does) tries again, e.g. after a download failed.
+        """
+        if name in self._models:
+            return self._models[name]
+        if name in self._errors and not retry:
+            return None
+
+        with self._lock:
+            if name in self._models:
+                return self._models[name]
+            if name in self._errors and not retry:
+                return None
+            print(f"Loading AI model: {name}...")
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                print(f"AI model failed to load: {name}: {e}")
+                self._errors[name] = str(e)
+                return None
+            print(f"AI model loaded: {name}")
+            self._models[name] = model
+            self._errors.pop(name, None)
+            return model
+
+    def lazy(self, name):
+        return LazyModel(self, name)
+
+    def warm_up(self, names=None):
+        """Load the given models (all registered ones by default), retrying earlier failures,
+        and return their status"""
+        for name in names or list(self._loaders):
+            self.get(name, retry=True)
+        return self.status()
+
+    def status(self):
+        status = {}
+        for name in self._loaders:
+            if name in self._models:
+                status[name] = 'loaded'
+            elif name in self._errors:
+                status[name] = f"failed: {self._errors[name]}"
+            else:
+                status[name] = 'not loaded'
+        return status
+
+    def warm_up_required(self, groups):
+        """Load one model of each group, trying them in order and retrying earlier failures,
+        and return the status"""
+        for group in groups:
+            for name in group:
+                if self.get(name, retry=True) is not None:
+                    break
+        return self.status()
+
+    def loaded(self, name):
+        return name in self._models
+
+    def ready(self, groups=None):
+        """Whether one model of every group (by default, every registered model) is loaded"""
+        if groups is None:
+            groups = [(name,) for name in self._loaders]
+        return all(any(name in self._models for name in group) for group in groups)
+
+
+class LazyModel:
+    """Stands in for a pipeline and loads it through the registry when first touched"""
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        return self._registry.get(self._name)(*args, **kwargs)
+
+    def __bool__(self):
+        return self._registry.get(self._name) is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.get(self._name), attr)
+
+
+registry = ModelRegistry()
+registry.register('sentiment_analyzer', load_sentiment_analyzer)
+registry.register('text_generator', load_text_generator)
+registry.register('text_embedder', load_text_embedder)
+
+
+if __name__ == '__main__':
+    # python models.py [name ...] downloads and loads models ahead of serving
+    for name, state in registry.warm_up(sys.argv[1:] or None).items():
+        print(f"{name}: {state}")
@@ -0,0 +1,115 @@
+"""Compact track objects, JSON encoding and response compression shared by both apps.
+
+orjson and brotli are optional: without them JSON falls back to the json module and
+responses are only gzip-compressed.
+"""
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# What a compact response keeps of each track field; the frontend needs nothing else
+TRACK_FIELDS = {
+    'id': lambda track: track['id'],
+    'name': lambda track: track.get('name', ''),
+    'artists': lambda track: [
+        {'id': artist.get('id'), 'name': artist.get('name', '')} for artist in track.get('artists') or []
+    ],
+    'album': lambda track: {
+        'name': (track.get('album') or {}).get('name'),
+        'images': ((track.get('album') or {}).get('images') or [])[:1],
+    },
+    'popularity': lambda track: track.get('popularity', 0),
+    'preview_url': lambda track: track.get('preview_url'),
+    'external_urls': lambda track: {'spotify': (track.get('external_urls') or {}).get('spotify')},
+    'ai_explanation': lambda track: track.get('ai_explanation'),
+    'match_quality': lambda track: track.get('match_quality'),
+    'similarity_score': lambda track: track.get('similarity_score'),
+}
+
+# Fields added by the recommendation pipeline, left out of tracks that do not have them
+RECOMMENDATION_FIELDS = ('ai_explanation', 'match_quality', 'similarity_score')
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/html', 'text/css', 'text/plain', 'text/javascript')
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 500
+
+
+def parse_fields(value):
+    """Turn a fields= parameter into the field names to keep, or None for full Spotify objects.
+
+    Raises ValueError naming the unknown fields.
+    """
+    if value is None or value == '':
+        return tuple(TRACK_FIELDS)
+    if value == 'full':
+        return None
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in TRACK_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}; use 'full' or some of {', '.join(TRACK_FIELDS)}")
+    return fields
+
+
+def compact_track(track, fields=tuple(TRACK_FIELDS)):
+    """The requested fields of a track, in their compact form; fields=None keeps the whole object"""
+    if fields is None:
+        return track
+    return {
+        name: TRACK_FIELDS[name](track)
+        for name in fields
+        if name not in RECOMMENDATION_FIELDS or name in track
+    }
+
+
+def dumps(obj):
+    """Serialize obj to compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(',', ':'), default=_to_builtin).encode()
+
+
+def choose_encoding(accept_encoding):
+    """The best content coding both sides support, or None"""
+    accepted = set()
+    for coding in (accept_encoding or '').lower().split(','):
+        name, _, params = coding.partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compressible_type(content_type):
+    return (content_type or '').split(';')[0].strip() in COMPRESSIBLE_TYPES
+
+
+def compressible(content_type, size):
+    return size >= MIN_COMPRESS_SIZE and compressible_type(content_type)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _to_builtin(value):
+    # numpy scalars and arrays
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,240 @@
+"""Offline recommendation lists for popular seed tracks.
+
+The recommendation endpoints look here before running the pipeline live. Fill it with:
+
+    python precompute.py run --ids popular.txt --workers 4 --concurrency 8
+    python precompute.py run --playlist 37i9dQZF1DXcBWIGoYBM5M --description "" --description "chill"
+    python precompute.py stats
+
+Runs are resumable: seeds computed within --max-age seconds are skipped, so an interrupted or
+scheduled run only does the work that is missing or out of date.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from connection import ProcessConnection
+
+
+class PrecomputedStore:
+    """SQLite table of zlib-compressed recommendation lists keyed like the result cache.
+
+    Entries older than max_age are ignored by get(). With no path the store is disabled.
+    """
+
+    def __init__(self, path='precomputed.db', max_age=7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._db = ProcessConnection(
+            path,
+            'PRAGMA journal_mode=WAL',
+            'CREATE TABLE IF NOT EXISTS recommendations (key TEXT PRIMARY KEY, data BLOB, computed_at REAL)',
+        )
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __bool__(self):
+        return bool(self.path)
+
+    def get(self, key):
+        if not self.path:
+            return None
+        with self._lock:
+            row = self._db.get().execute(
+                'SELECT data FROM recommendations WHERE key = ? AND computed_at >= ?',
+                (key, time.time() - self.max_age)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key, recommendations):
+        if not self.path:
+            return
+        data = zlib.compress(json.dumps(recommendations, separators=(',', ':')).encode())
+        with self._lock:
+            conn = self._db.get()
+            conn.execute(
+                'INSERT OR REPLACE INTO recommendations (key, data, computed_at) VALUES (?, ?, ?)',
+                (key, data, time.time())
+            )
+            conn.commit()
+
+    def fresh_keys(self, keys, max_age):
+        """The keys among keys computed less than max_age seconds ago"""
+        keys = list(keys)
+        if not self.path or not keys:
+            return set()
+        fresh = set()
+        with self._lock:
+            conn = self._db.get()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    f'SELECT key FROM recommendations WHERE computed_at >= ? AND key IN ({",".join("?" * len(chunk))})',
+                    [time.time() - max_age, *chunk]
+                ).fetchall()
+                fresh.update(key for key, in rows)
+        return fresh
+
+    def stats(self):
+        rows, size = 0, 0
+        if self.path:
+            with self._lock:
+                rows, size = self._db.get().execute(
+                    'SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM recommendations'
+                ).fetchone()
+        return {'rows': rows, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
+
+
+def init_worker(threads):
+    """Import the app in a fresh worker process with its share of the CPU threads"""
+    if threads:
+        os.environ['INFERENCE_THREADS'] = str(threads)
+    global server
+    import server
+    # Every worker loads the feature index, but only the track store is written concurrently;
+    # the features the workers fetch reach the index through the store on the next start
+    server.feature_index.path = None
+    # Seeds need the warmed tracks as neighbour candidates from the start, not as they load
+    server.seed_from_track_store()
+    # Load the models now, so a worker whose models cannot load fails its seeds up front
+    server.model_registry.warm_up_required(server.REQUIRED_MODELS)
+
+
+def precompute_batch(seeds, budget_seconds):
+    """Run the pipeline for (key, track_id, description) seeds on threads, so the model
+    schedulers batch inference across them. Returns (key, recommendations or None, error) tuples.
+    """
+    token = server.get_access_token()
+    # Without the models the pipeline falls back to placeholder explanations and unscored
+    # candidates, which must not be stored for days as if they were the real list
+    unavailable = None
+    if not server.model_registry.ready(server.REQUIRED_MODELS):
+        unavailable = ', '.join(
+            f"{name} {state}" for name, state in server.model_registry.status().items() if state != 'loaded'
+        )
+
+    def compute(seed):
+        key, track_id, description = seed
+        if unavailable:
+            return key, None, f"models not loaded ({unavailable})"
+        if not token:
+            return key, None, 'no access token'
+        try:
+            track_data = server.get_track(track_id, token)
+            if not track_data:
+                return key, None, 'track not found'
+            budget = server.Budget(budget_seconds)
+            recommendations, skipped = server.collect_recommendations(track_data, description, token, budget)
+            if skipped:
+                return key, None, f"degraded ({', '.join(skipped)})"
+            return key, recommendations, None
+        except Exception as e:
+            return key, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=len(seeds)) as executor:
+        return list(executor.map(compute, seeds))
+
+
+def plan(store, track_ids, descriptions, max_age):
+    """(key, track_id, description) for every seed without a fresh stored list"""
+    from server import recommendation_cache_key
+
+    seeds = []
+    for track_id in dict.fromkeys(track_ids):
+        for description in descriptions:
+            seeds.append((recommendation_cache_key(track_id, description), track_id, description))
+    fresh = store.fresh_keys([key for key, _, _ in seeds], max_age)
+    return [seed for seed in seeds if seed[0] not in fresh], len(seeds)
+
+
+def run(store, seeds, workers=2, concurrency=8, budget_seconds=60):
+    """Compute seeds in worker processes, storing each list as soon as it is ready"""
+    batches = [seeds[start:start + concurrency] for start in range(0, len(seeds), concurrency)]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    done, failed = 0, 0
+    started = time.perf_counter()
+
+    # Spawned workers start from a clean interpreter instead of inheriting this process's threads
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=init_worker, initargs=(threads,)) as pool:
+        for results in pool.imap_unordered(_precompute_batch, [(batch, budget_seconds) for batch in batches]):
+            for key, recommendations, error in results:
+                if recommendations:
+                    store.put(key, recommendations)
+                    done += 1
+                else:
+                    failed += 1
+                    print(f"Precompute failed for {key}: {error or 'no recommendations'}")
+            elapsed = time.perf_counter() - started
+            print(f"{done + failed}/{len(seeds)} seeds, {60 * (done + failed) / elapsed:.1f} seeds/min")
+
+    elapsed = time.perf_counter() - started
+    return {
+        'computed': done,
+        'failed': failed,
+        'seconds': elapsed,
+        'seeds_per_minute': 60 * done / elapsed if elapsed else 0.0,
+    }
+
+
+def _precompute_batch(args):
+    return precompute_batch(*args)
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Precompute recommendations for popular seed tracks')
+    parser.add_argument('--path', default=os.getenv('PRECOMPUTED_PATH', 'precomputed.db'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='compute missing and out-of-date seeds')
+    run_parser.add_argument('track_ids', nargs='*', help='Spotify track IDs')
+    run_parser.add_argument('--ids', help='file with one track ID per line')
+    run_parser.add_argument('--playlist', action='append', default=[], help='playlist ID (repeatable)')
+    run_parser.add_argument('--description', action='append',
+                            help='user description to precompute for each seed (repeatable, default: none)')
+    run_parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    run_parser.add_argument('--concurrency', type=int, default=8, help='seeds in flight per worker')
+    run_parser.add_argument('--max-age', type=float, default=24 * 3600,
+                            help='recompute seeds older than this many seconds (0 recomputes everything)')
+    run_parser.add_argument('--budget', type=float, default=60, help='seconds allowed per seed')
+    commands.add_parser('stats', help='show stored lists')
+    args = parser.parse_args()
+
+    store = PrecomputedStore(args.path)
+    if args.command == 'stats':
+        stats = store.stats()
+        print(f"{stats['rows']} recommendation lists, {stats['bytes'] / 1024:.0f} KiB")
+    else:
+        track_ids = list(args.track_ids)
+        if args.ids:
+            with open(args.ids) as f:
+                track_ids += f.read().split()
+        if args.playlist:
+            from server import get_access_token, spotify
+            from track_store import playlist_track_ids
+
+            token = get_access_token()
+            for playlist_id in args.playlist:
+                track_ids += playlist_track_ids(spotify, token, playlist_id)
+
+        seeds, total = plan(store, track_ids, args.description or [''], args.max_age)
+        print(f"{total} seeds: {total - len(seeds)} up to date, computing {len(seeds)}")
+        if seeds:
+            result = run(store, seeds, args.workers, args.concurrency, args.budget)
+            print(
+                f"Computed {result['computed']} seeds ({result['failed']} failed) in {result['seconds']:.1f}s: "
+                f"{result['seeds_per_minute']:.1f} seeds/min"
+            )
@@ -0,0 +1,91 @@
+import numpy as np
+
+# feature: (default value, difference thresholds, score points per bucket, similarity points per bucket)
+# A difference below thresholds[i] (and not below thresholds[i - 1]) earns the i-th points; beyond the
+# last threshold earns nothing.
+CORE_RULES = {
+    'tempo': (120, [10, 25, 40], [50, 30, 15], [3, 2, 1]),
+    'energy': (0.5, [0.15, 0.3, 0.5], [40, 20, 10], [3, 2, 1]),
+    'valence': (0.5, [0.2, 0.4, 0.6], [35, 18, 8], [3, 2, 1]),
+    'danceability': (0.5, [0.2], [20], [1]),
+}
+
+# Audio features the original ladder ignored, enabled with extended=True
+EXTENDED_RULES = {
+    'acousticness': (0.5, [0.15, 0.3], [15, 8], [1, 0]),
+    'instrumentalness': (0.0, [0.2], [10], [1]),
+    'loudness': (-8.0, [3, 6], [10, 5], [1, 0]),  # dB
+    'key': (0, [1, 2], [6, 3], [1, 0]),  # semitones around the circle, so 11 and 0 are neighbours
+    'mode': (1, [1], [4], [0]),
+}
+
+BASE_SCORE = 50
+# Minimum similarity points for each match quality, best first
+QUALITY_THRESHOLDS = [('green', 8), ('yellow', 5)]
+
+
+class SimilarityScorer:
+    """Scores every candidate against the seed track's audio features in one NumPy pass"""
+
+    def __init__(self, rules=None, extended=False, quality_thresholds=None, base_score=BASE_SCORE):
+        if rules is None:
+            rules = dict(CORE_RULES)
+            if extended:
+                rules.update(EXTENDED_RULES)
+        self.names = list(rules)
+        self.defaults = np.array([rules[name][0] for name in self.names], dtype=np.float32)
+        self.quality_thresholds = quality_thresholds or QUALITY_THRESHOLDS
+        self.base_score = base_score
+
+        # Ragged ladders padded into rectangular tables; the extra bucket scores 0
+        width = max(len(rule[1]) for rule in rules.values())
+        self.thresholds = np.full((len(rules), width), np.inf, dtype=np.float32)
+        self.score_points = np.zeros((len(rules), width + 1), dtype=np.float32)
+        self.similarity_points = np.zeros((len(rules), width + 1), dtype=np.float32)
+        for row, name in enumerate(self.names):
+            _, thresholds, score_points, similarity_points = rules[name]
+            self.thresholds[row, :len(thresholds)] = thresholds
+            self.score_points[row, :len(score_points)] = score_points
+            self.similarity_points[row, :len(similarity_points)] = similarity_points
+
+    def feature_matrix(self, features_list):
+        """Stack feature dicts into an (n, features) float32 matrix, filling gaps with defaults"""
+        matrix = np.empty((len(features_list), len(self.names)), dtype=np.float32)
+        for row, features in enumerate(features_list):
+            for column, name in enumerate(self.names):
+                value = features.get(name)
+                matrix[row, column] = self.defaults[column] if value is None else value
+        return matrix
+
+    def score(self, seed_features, candidate_features):
+        """Return (similarity_scores, match_qualities) for each candidate.
+
+        Candidates without features keep the base score and a 'yellow' match.
+        """
+        count = len(candidate_features)
+        scores = np.full(count, self.base_score, dtype=np.float32)
+        qualities = np.full(count, 'yellow', dtype=object)
+        present = np.array([bool(features) for features in candidate_features], dtype=bool)
+        if not seed_features or not present.any():
+            return scores, qualities
+
+        seed = self.feature_matrix([seed_features])[0]
+        matrix = self.feature_matrix([features for features in candidate_features if features])
+        diffs = np.abs(matrix - seed)
+        if 'key' in self.names:
+            column = self.names.index('key')
+            diffs[:, column] = np.minimum(diffs[:, column], 12 - diffs[:, column])
+
+        # Bucket index per (candidate, feature): how many thresholds the difference reaches
+        buckets = (diffs[:, :, None] >= self.thresholds[None, :, :]).sum(axis=2)
+        rows = np.arange(len(self.names))
+        points = self.score_points[rows, buckets].sum(axis=1)
+        similarity = self.similarity_points[rows, buckets].sum(axis=1)
+
+        matched = np.full(len(matrix), 'red', dtype=object)
+        for quality, minimum in reversed(self.quality_thresholds):
+            matched[similarity >= minimum] = quality
+
+        scores[present] += points
+        qualities[present] = matched
+        return scores, qualities
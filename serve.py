@@ -0,0 +1,184 @@
+"""Pre-fork production launcher.
+
+The master loads the models the settings use once, then forks workers that share the weights copy-on-write
+and accept connections from one listening socket:
+
+    python serve.py --workers 4 --bind 0.0.0.0:8000
+    python serve.py --app asgi --workers 2
+
+Each worker caps its intra-op threads at its share of the cores and runs one call through
+every model before it starts accepting, so requests only reach warmed workers. Workers that
+die are replaced; SIGTERM or Ctrl-C stops them all, and each saves its feature index on the way
+out.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+# Workers that die sooner than this after starting are restarted after a pause
+MIN_WORKER_UPTIME = 5
+
+
+def worker_threads(workers, threads=None):
+    """Intra-op threads per worker: INFERENCE_THREADS when set, else an even share of the cores"""
+    if threads is None:
+        threads = int(os.getenv('INFERENCE_THREADS', '0'))
+    return threads or max(1, (os.cpu_count() or 1) // workers)
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+
+def warm_worker():
+    """One tiny call per loaded model, so thread pools and lazy buffers exist before traffic arrives.
+    Models the master did not load are left alone."""
+    from models import registry
+
+    calls = {
+        'sentiment_analyzer': lambda model: model(['warm up'], truncation=True),
+        'text_generator': lambda model: model(['warm up'], max_new_tokens=1, do_sample=False),
+        'text_embedder': lambda model: model(['warm up']),
+    }
+    for name, call in calls.items():
+        if not registry.loaded(name):
+            continue
+        model = registry.get(name)
+        try:
+            call(model)
+        except Exception as e:
+            print(f"Worker warm-up error for {name}: {e}")
+
+
+def run_worker(app, listener, threads):
+    """Serve app ('wsgi' for server.py, 'asgi' for asgi.py) on the inherited listening socket"""
+    # Ctrl-C reaches the whole process group; the master turns it into a SIGTERM per worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+
+    import server
+
+    host, port = listener.getsockname()[:2]
+    try:
+        if app == 'asgi':
+            import uvicorn
+
+            import asgi
+
+            warm_worker()
+            uvicorn_server = uvicorn.Server(uvicorn.Config(asgi.app, log_level='warning'))
+            # uvicorn re-raises the SIGTERM it caught once it has shut down; let that return here
+            signal.signal(signal.SIGTERM, lambda *_: None)
+            print(f"Worker {os.getpid()} ready")
+            uvicorn_server.run(sockets=[listener])
+        else:
+            from werkzeug.serving import make_server
+
+            warm_worker()
+            httpd = make_server(host, port, server.app, threaded=True, fd=listener.fileno())
+            signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+            print(f"Worker {os.getpid()} ready")
+            httpd.serve_forever()
+    finally:
+        # Workers leave through os._exit, which skips server.py's atexit save
+        server.feature_index.save()
+
+
+class Master:
+    """Forks workers over one listening socket and replaces any that exit"""
+
+    def __init__(self, app, listener, workers, threads):
+        self.app = app
+        self.listener = listener
+        self.workers = workers
+        self.threads = threads
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.listener, self.threads)
+            except BaseException as e:
+                print(f"Worker {os.getpid()} error: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if self.stopping or started is None:
+                continue
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            if time.monotonic() - started < MIN_WORKER_UPTIME:
+                time.sleep(MIN_WORKER_UPTIME)
+            if not self.stopping:
+                self.spawn()
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Serve the app from pre-forked workers sharing one copy of the models')
+    parser.add_argument('--app', choices=('wsgi', 'asgi'), default=os.getenv('SERVE_APP', 'wsgi'),
+                        help='wsgi serves server.py on threaded werkzeug workers, asgi serves asgi.py on uvicorn')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVE_WORKERS', '0')) or max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--bind', default=os.getenv('SERVE_BIND', '0.0.0.0:8000'))
+    parser.add_argument('--threads', type=int, help='intra-op threads per worker (default: cores / workers)')
+    parser.add_argument('--backlog', type=int, default=2048)
+    args = parser.parse_args()
+
+    threads = worker_threads(args.workers, args.threads)
+    # Set before any model loads: ONNX sessions and torch read them at load time, and fast
+    # tokenizers must not start their thread pool before the fork
+    os.environ['INFERENCE_THREADS'] = str(threads)
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+    from models import registry, required_models
+
+    started = time.perf_counter()
+    # Only the models these settings use, e.g. no embedder with DESCRIPTION_MATCHER=sentiment
+    for name, state in registry.warm_up_required(required_models()).items():
+        print(f"{name}: {state}")
+    print(f"Models loaded in {time.perf_counter() - started:.1f}s")
+    # Keep the loaded objects out of future collections, so the collector does not touch
+    # (and copy) their pages in every worker
+    gc.collect()
+    gc.freeze()
+
+    host, port = parse_bind(args.bind)
+    listener = socket.create_server((host, port), backlog=args.backlog)
+    listener.set_inheritable(True)
+    print(f"Serving {args.app} on {host}:{port} with {args.workers} workers, {threads} inference threads each")
+    Master(args.app, listener, args.workers, threads).run()
@@ -1,41 +1,59 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import requests
 import os
-import base64
+import atexit
 from dotenv import load_dotenv
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
 
-# Initialize AI models
-sentiment_analyzer = None
-text_generator = None
-
-try:
-    from transformers import pipeline, set_seed
-    print("Loading AI models...")
-    
-    sentiment_analyzer = pipeline(
-        "sentiment-analysis", 
-        model="distilbert-base-uncased-finetuned-sst-2-english"
-    )
-    
-    text_generator = pipeline(
-        "text-generation", 
-        model="EleutherAI/gpt-neo-125M",
-        pad_token_id=50256
-    )
-    
-    set_seed(42)
-    print("AI models loaded successfully!")
-    
-except Exception as e:
-    print(f"AI models failed to load: {e}")
-    sentiment_analyzer = None
-    text_generator = None
+from budget import Budget
+from cache import MemoryBackend, ResultCache, create_response_cache
+from embeddings import EmbeddingCache, cosine_similarities, track_text
+from feature_index import FeatureIndex
+from inference import BatchScheduler
+from metrics import in_context, registry as metrics
+from singleflight import SingleFlight
+from models import registry as model_registry, required_models
+from payload import choose_encoding, compact_track, compress, compressible, dumps, parse_fields
+from scoring import SimilarityScorer
+from spotify_client import API_URL, TOKEN_URL, SpotifyClient, TokenManager
+from precompute import PrecomputedStore
+from track_store import AUDIO_FEATURES_BATCH_SIZE, TRACKS_BATCH_SIZE, TrackStore
+from typeahead import TypeaheadIndex
 
 load_dotenv()
 
+# AI models load on first use, or up front via /api/warmup, `python models.py` or PRELOAD_MODELS
+sentiment_analyzer = model_registry.lazy('sentiment_analyzer')
+text_generator = model_registry.lazy('text_generator')
+text_embedder = model_registry.lazy('text_embedder')
+
+# Models /api/ready waits for and warm-ups load: only those these settings use
+REQUIRED_MODELS = required_models()
+
+if os.getenv('PRELOAD_MODELS', '').lower() in ('1', 'true', 'yes'):
+    # With gunicorn --preload this runs once in the master and forked workers share the weights
+    model_registry.warm_up_required(REQUIRED_MODELS)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify through payload.dumps: compact output, and orjson when it is installed"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with metrics.span('serialize'):
+            body = dumps(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 @app.route('/')
@@ -49,7 +67,45 @@ def static_files(filename):
 CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 
-def generate_ai_recommendations_with_explanations(user_description, original_track, token):
+# Every Spotify call goes through this pooled, rate-limited client
+spotify = SpotifyClient(
+    timeout=float(os.getenv('SPOTIFY_TIMEOUT_SECONDS', '10')),
+    max_retries=int(os.getenv('SPOTIFY_MAX_RETRIES', '3')),
+    rate_limit=float(os.getenv('SPOTIFY_RATE_LIMIT', '0')),
+    pool_size=int(os.getenv('SPOTIFY_POOL_SIZE', '20')),
+    api_url=os.getenv('SPOTIFY_API_URL', API_URL)
+)
+
+# Cache for Spotify track, search and audio-feature responses
+response_cache = create_response_cache(
+    os.getenv('RESPONSE_CACHE_BACKEND', 'memory'),
+    os.getenv('RESPONSE_CACHE_PATH', 'spotify_cache.db'),
+    int(os.getenv('RESPONSE_CACHE_SIZE', '10000'))
+)
+
+def upstream_endpoint(path):
+    """Collapse a Spotify path like /tracks/<id> into an endpoint class like 'track'"""
+    if path.startswith('http'):
+        return 'token' if path.rstrip('/').endswith('/token') else 'other'
+    parts = path.strip('/').split('/')
+    name = parts[0].replace('-', '_')
+    return name[:-1] if len(parts) > 1 and name.endswith('s') else name
+
+def observe_upstream(path, status, seconds):
+    endpoint = upstream_endpoint(path)
+    metrics.inc('upstream_calls', endpoint=endpoint)
+    metrics.observe('upstream_seconds', seconds, endpoint=endpoint)
+    if status != 200:
+        metrics.inc('upstream_errors', endpoint=endpoint, status=status)
+
+def observe_cache_lookup(endpoint_class, hit):
+    metrics.inc('cache_hits' if hit else 'cache_misses', cache=endpoint_class)
+
+# Every Spotify call and cache lookup is counted, per process and per request
+spotify.on_response = observe_upstream
+response_cache.on_lookup = observe_cache_lookup
+
+def generate_ai_recommendations_with_explanations(user_description, original_track, token, audio_features=None):
     """Step 1: Generate exactly 9 song recommendations using AI"""
     if not text_generator:
         return []
@@ -60,7 +116,8 @@ def generate_ai_recommendations_with_explanations(user_description, original_tra
     user_description = user_description.replace('"', '').replace("'", '').strip()[:200]  # Limit length
     
     # Get audio features for context
-    audio_features = get_audio_features(original_track['id'], token)
+    if audio_features is None:
+        audio_features = get_audio_features(original_track['id'], token)
     features_text = ""
     
     if audio_features:
@@ -170,71 +227,572 @@ def generate_ai_recommendations_with_explanations(user_description, original_tra
             f"Recommended - Final Track"
         ]
 
+EXPLANATION_BATCH_SIZE = int(os.getenv('EXPLANATION_BATCH_SIZE', '9'))
+
+# Sampling settings for explanations; use_cache keeps past key/values between decode steps
+EXPLANATION_OPTIONS = (
+    ('max_new_tokens', 20),
+    ('num_return_sequences', 1),
+    ('temperature', 0.8),
+    ('do_sample', True),
+    ('use_cache', True),
+    ('return_full_text', False),
+    ('pad_token_id', 50256),
+    ('eos_token_id', 50256)
+)
+
+# Concurrent requests share model calls: inputs queue up for at most INFERENCE_MAX_WAIT_MS
+# and run together in batches of up to INFERENCE_MAX_BATCH
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', '32'))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', '10'))
+INFERENCE_MAX_QUEUE = int(os.getenv('INFERENCE_MAX_QUEUE', '1024'))
+
+def run_generation_batch(prompts, options):
+    return text_generator(prompts, batch_size=EXPLANATION_BATCH_SIZE, **dict(options))
+
+def run_sentiment_batch(texts, options):
+    return sentiment_analyzer(texts, batch_size=SENTIMENT_BATCH_SIZE, truncation=True)
+
+def run_embedding_batch(texts, options):
+    return list(text_embedder(texts, batch_size=EMBEDDING_BATCH_SIZE))
+
+generation_scheduler = BatchScheduler(
+    'text_generation', run_generation_batch,
+    INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS / 1000, INFERENCE_MAX_QUEUE
+)
+sentiment_scheduler = BatchScheduler(
+    'sentiment', run_sentiment_batch,
+    INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS / 1000, INFERENCE_MAX_QUEUE
+)
+embedding_scheduler = BatchScheduler(
+    'embedding', run_embedding_batch,
+    INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS / 1000, INFERENCE_MAX_QUEUE
+)
+
+class ModelCall:
+    """A batched model call a pipeline step hands to its driver instead of blocking on it.
+    
+    The inputs go to scheduler with options and the driver sends back their results, or throws
+    TimeoutError after timeout seconds. Calls with a flight key share the inputs already queued
+    by an identical call (see SingleFlight.wait). run() waits on this thread; asgi.py awaits
+    the futures instead, so no thread is held while the batch runs.
+    """
+    
+    def __init__(self, scheduler, inputs, options=(), timeout=None, flight=None):
+        self.scheduler = scheduler
+        self.inputs = inputs
+        self.options = options
+        self.timeout = timeout
+        self.flight = flight
+        self._shared = None
+    
+    def submit(self):
+        """Queue the inputs, or join an identical flight; returns one future per input"""
+        if self.flight is None:
+            return self.scheduler.submit(self.inputs, self.options)
+        self._shared = in_flight.share(self.flight, self.scheduler.submit, self.inputs, self.options)
+        return self._shared[0]
+    
+    def abandon(self, pending):
+        """Give up on the pending futures; inputs nobody else waits for are withdrawn"""
+        if self._shared is None:
+            for future in pending:
+                future.cancel()
+        else:
+            in_flight.abandon(self.flight, self._shared, pending)
+    
+    def timed_out(self):
+        return TimeoutError(f"{self.scheduler.name} results not ready after {self.timeout}s")
+    
+    def run(self):
+        futures = self.submit()
+        _, pending = wait(futures, self.timeout)
+        if pending:
+            self.abandon(pending)
+            raise self.timed_out()
+        return [future.result() for future in futures]
+
+def run_steps(steps):
+    """Drive a generator of Calls and ModelCalls on this thread; returns the generator's value.
+    
+    A step's exception is thrown back into the generator, which may handle it.
+    """
+    result, error = None, None
+    while True:
+        try:
+            step = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        result, error = None, None
+        try:
+            result = step.run()
+        except Exception as e:
+            error = e
+
 def generate_individual_explanation(song_query, original_track, user_description, token=None):
     """Generate AI explanation for each specific song"""
-    if not text_generator:
-        return "Similar musical style."
+    return generate_explanations([song_query], original_track, user_description)[0]
+
+def model_timeout(budget):
+    """How long a model call may wait for its batch: the time left in the budget (None = no limit)"""
+    return None if budget is None else budget.remaining()
+
+def generate_explanations(song_queries, original_track, user_description, budget=None):
+    """Generate AI explanations for several songs in one padded, batched generation call.
     
-    # Extract song info from query
-    if ' - ' in song_query:
-        parts = song_query.split(' - ', 1)
-        rec_artist = parts[0].strip()
-        rec_title = parts[1].strip()
-    else:
-        rec_artist = "Artist"
-        rec_title = song_query
+    Returns None when the generation does not finish within the budget.
+    """
+    return run_steps(explanation_steps(song_queries, original_track, user_description, budget))
+
+def explanation_steps(song_queries, original_track, user_description, budget=None):
+    """generate_explanations as pipeline steps, yielding the generation as a ModelCall"""
+    with metrics.span('explanations'):
+        return (yield from _explanation_steps(song_queries, original_track, user_description, budget))
+
+def _explanation_steps(song_queries, original_track, user_description, budget):
+    if not text_generator:
+        return ["Similar musical style."] * len(song_queries)
+    if not song_queries:
+        return []
     
     orig_title = original_track['name']
     orig_artist = original_track['artists'][0]['name']
     
+    songs = []
+    for song_query in song_queries:
+        # Extract song info from query
+        if ' - ' in song_query:
+            parts = song_query.split(' - ', 1)
+            songs.append((parts[1].strip(), parts[0].strip()))
+        else:
+            songs.append((song_query, "Artist"))
+    
     try:
         # AI-only explanation generation
-        prompt = f"{rec_title} by {rec_artist} is similar to {orig_title} by {orig_artist} because"
+        prompts = [
+            f"{rec_title} by {rec_artist} is similar to {orig_title} by {orig_artist} because"
+            for rec_title, rec_artist in songs
+        ]
         
-        generated = text_generator(
-            prompt,
-            max_new_tokens=20,
-            num_return_sequences=1,
-            temperature=0.8,
-            do_sample=True,
-            pad_token_id=50256,
-            eos_token_id=50256
+        # Prompts are left-padded into one batch, together with other requests' prompts;
+        # identical prompt lists already in flight share that generation, each request waiting
+        # on it only as long as its own budget allows
+        generated = yield ModelCall(
+            generation_scheduler, prompts, EXPLANATION_OPTIONS, model_timeout(budget),
+            flight=('explanations', tuple(prompts))
         )
         
-        # Extract explanation
-        full_text = generated[0]['generated_text']
-        explanation = full_text.replace(prompt, '').strip()
-        
-        if explanation and len(explanation) > 5:
-            # Clean up the explanation
-            if '.' in explanation:
-                explanation = explanation.split('.')[0]
-            explanation = explanation.strip().rstrip(',').strip()
-            
-            if len(explanation) > 8:
-                return f"{rec_title} by {rec_artist} is similar to {orig_title} by {orig_artist} because {explanation}."
-        
-        return f"Both tracks share similar musical characteristics."
+        explanations = []
+        continuations = []
+        for (rec_title, rec_artist), output in zip(songs, generated):
+            if isinstance(output, list):
+                output = output[0]
+            # return_full_text=False: generated_text is only the continuation
+            continuations.append(output['generated_text'])
+            explanations.append(clean_explanation(output['generated_text'], rec_title, rec_artist, orig_title, orig_artist))
+        metrics.inc('model_items', len(prompts), model='text_generation')
+        metrics.inc('generated_tokens', count_tokens(continuations))
+        return explanations
         
+    except TimeoutError:
+        print(f"AI explanations timed out for {orig_title}")
+        return None
     except Exception as e:
         print(f"AI explanation error: {e}")
-        return f"Musical connection to {orig_title}."
+        return [f"Musical connection to {orig_title}."] * len(song_queries)
+
+def template_explanations(recommendations, original_track, audio_features):
+    """Explanations without the text generator, for requests out of time"""
+    orig_title = original_track['name']
+    if not audio_features:
+        return [f"Musical connection to {orig_title}."] * len(recommendations)
+    
+    energy = "high-energy" if audio_features.get('energy', 0.5) > 0.6 else "laid-back"
+    mood = "upbeat" if audio_features.get('valence', 0.5) > 0.6 else "moody"
+    explanations = []
+    for track in recommendations:
+        if track.get('match_quality') == 'green':
+            explanations.append(f"Closely matches the {energy}, {mood} sound of {orig_title}.")
+        else:
+            explanations.append(f"Shares some of the {energy}, {mood} feel of {orig_title}.")
+    return explanations
 
+def count_tokens(texts):
+    """Token count of generated texts, by the generator's tokenizer when it has one"""
+    tokenizer = getattr(text_generator, 'tokenizer', None)
+    if tokenizer is None:
+        return sum(len(text.split()) for text in texts)
+    return sum(len(tokenizer(text)['input_ids']) for text in texts)
 
+def clean_explanation(explanation, rec_title, rec_artist, orig_title, orig_artist):
+    """Turn raw generated text into a one-sentence explanation"""
+    explanation = explanation.strip()
+    
+    if explanation and len(explanation) > 5:
+        # Clean up the explanation
+        if '.' in explanation:
+            explanation = explanation.split('.')[0]
+        explanation = explanation.strip().rstrip(',').strip()
+        
+        if len(explanation) > 8:
+            return f"{rec_title} by {rec_artist} is similar to {orig_title} by {orig_artist} because {explanation}."
+    
+    return f"Both tracks share similar musical characteristics."
+
+
+
+# Every track whose audio features we fetch becomes a nearest-neighbour candidate
+FEATURE_INDEX_NEIGHBORS = int(os.getenv('FEATURE_INDEX_NEIGHBORS', '30'))
+feature_index = FeatureIndex(os.getenv('FEATURE_INDEX_PATH', 'feature_index') or None)
+atexit.register(feature_index.save)
+
+# Durable track metadata and audio features that survive restarts; TRACK_STORE_PATH='' disables it.
+# Pre-warm it with `python track_store.py warm`.
+track_store = TrackStore(os.getenv('TRACK_STORE_PATH', 'tracks.db') or None)
+
+# Prefix index over every track seen in searches and lookups. /api/search answers from it and
+# only asks Spotify when it finds fewer than TYPEAHEAD_MIN_RESULTS tracks (0 always asks Spotify).
+TYPEAHEAD_MIN_RESULTS = int(os.getenv('TYPEAHEAD_MIN_RESULTS', '5'))
+typeahead = TypeaheadIndex(int(os.getenv('TYPEAHEAD_MAX_TRACKS', '50000')))
+
+def seed_from_track_store():
+    """Make warmed tracks candidates for the nearest-neighbour step and typeahead too"""
+    for stored_features in track_store.iter_audio_features():
+        feature_index.add_many(stored_features)
+    for stored_tracks in track_store.iter_tracks():
+        typeahead.add_many(stored_tracks.values())
+
+_seeding_pid = None
+_seeding_lock = threading.Lock()
+
+def start_seeding():
+    """Run seed_from_track_store on a background thread, once per process.
+    
+    Called on a worker's first request rather than at import, so startup does not grow with the
+    store and a gunicorn --preload master never starts feature_index's save thread before it forks.
+    """
+    global _seeding_pid
+    if _seeding_pid == os.getpid():
+        return
+    with _seeding_lock:
+        if _seeding_pid == os.getpid():
+            return
+        _seeding_pid = os.getpid()
+    threading.Thread(target=seed_from_track_store, name='track-store-seed', daemon=True).start()
+
+# Concurrent identical Spotify and model calls share one in-flight execution
+in_flight = SingleFlight()
+
+def cached_tracks(track_ids):
+    """Look tracks up in the response cache, then the track store. Returns (found dict, missing IDs)."""
+    found = {}
+    missing = []
+    for track_id in dict.fromkeys(track_ids):
+        cached = response_cache.get('track', track_id)
+        if cached is not None:
+            found[track_id] = cached
+        else:
+            missing.append(track_id)
+    
+    if missing and track_store:
+        stored = track_store.get_tracks(missing)
+        for track_id, track in stored.items():
+            response_cache.set('track', track_id, track)
+        found.update(stored)
+        missing = [track_id for track_id in missing if track_id not in stored]
+    return found, missing
+
+def remember_tracks(tracks):
+    """Keep track objects from any Spotify response in the cache and the track store"""
+    tracks = [track for track in tracks if track and track.get('id')]
+    for track in tracks:
+        response_cache.set('track', track['id'], track)
+    track_store.upsert_tracks(tracks)
+    typeahead.add_many(tracks)
+
+def cached_audio_features(track_ids):
+    """Like cached_tracks, for audio features; everything found also joins the feature index"""
+    found = {}
+    missing = []
+    for track_id in dict.fromkeys(track_ids):
+        cached = response_cache.get('audio_features', track_id)
+        if cached is not None:
+            found[track_id] = cached
+        else:
+            missing.append(track_id)
+    
+    if missing and track_store:
+        stored = track_store.get_audio_features(missing)
+        for track_id, features in stored.items():
+            response_cache.set('audio_features', track_id, features)
+        found.update(stored)
+        missing = [track_id for track_id in missing if track_id not in stored]
+    
+    feature_index.add_many(found)
+    return found, missing
+
+def remember_audio_features(items):
+    """Keep audio features from a Spotify response in the cache, the track store and the feature index"""
+    items = [item for item in items if item and item.get('id')]
+    for item in items:
+        response_cache.set('audio_features', item['id'], item)
+    track_store.upsert_audio_features(items)
+    feature_index.add_many({item['id']: item for item in items})
+
+def get_track(track_id, token):
+    """Get track metadata, served from the response cache or track store when possible"""
+    found, _ = cached_tracks([track_id])
+    if track_id in found:
+        return found[track_id]
+    return in_flight.do(('track', track_id), fetch_track, track_id, token)
+
+def fetch_track(track_id, token):
+    try:
+        return track_from_response(spotify.get(f'/tracks/{track_id}', token))
+    except Exception as e:
+        print(f"Track lookup error: {e}")
+    return None
+
+# Spotify responses are read and remembered the same way by both apps; only the request differs
+
+def track_from_response(response):
+    """The track in a /tracks/<id> response, or None"""
+    if response.status_code != 200:
+        return None
+    track = response.json()
+    remember_tracks([track])
+    return track
+
+def tracks_from_response(response):
+    """The tracks in a /tracks?ids= response, keyed by ID"""
+    if response.status_code != 200:
+        return {}
+    batch = [track for track in response.json().get('tracks') or [] if track]
+    remember_tracks(batch)
+    return {track['id']: track for track in batch}
+
+def search_from_response(response, key):
+    """(status_code, JSON body or error text) for a /search response, cached under key"""
+    if response.status_code != 200:
+        return response.status_code, response.text
+    results = response.json()
+    response_cache.set('search', key, results)
+    remember_tracks(results.get('tracks', {}).get('items') or [])
+    return 200, results
+
+def audio_features_from_response(response):
+    """The features in an /audio-features/<id> response, or None"""
+    if response.status_code != 200:
+        return None
+    features = response.json()
+    remember_audio_features([features])
+    return features
+
+def audio_features_batch_from_response(response):
+    """The features in an /audio-features?ids= response, keyed by ID"""
+    if response.status_code != 200:
+        return {}
+    # Unknown IDs come back as null entries
+    items = [item for item in response.json().get('audio_features') or [] if item]
+    remember_audio_features(items)
+    return {item['id']: item for item in items}
+
+def get_tracks(track_ids, token):
+    """Get metadata for many tracks, 50 IDs per request, as a dict keyed by ID"""
+    tracks, missing = cached_tracks(track_ids)
+    
+    for start in range(0, len(missing), TRACKS_BATCH_SIZE):
+        chunk = missing[start:start + TRACKS_BATCH_SIZE]
+        try:
+            response = spotify.get('/tracks', token, params={'ids': ','.join(chunk), 'market': 'US'})
+            tracks.update(tracks_from_response(response))
+        except Exception as e:
+            print(f"Tracks batch error: {e}")
+    
+    return tracks
+
+def spotify_search(query, token, limit=5):
+    """Search Spotify for tracks, returning (status_code, JSON body or error text)"""
+    key = search_cache_key(query, limit)
+    cached = response_cache.get('search', key)
+    if cached is not None:
+        return 200, cached
+    # Callers annotate the returned tracks, so each one gets its own copy
+    return in_flight.do(('search', key), fetch_search, query, token, limit, key, copy_result=True)
+
+def fetch_search(query, token, limit, key):
+    return search_from_response(spotify.get('/search', token, params=search_params(query, limit)), key)
+
+def search_cache_key(query, limit):
+    return f"{query.strip().lower()}|{limit}"
+
+def search_params(query, limit):
+    return {'q': query, 'type': 'track', 'limit': limit, 'market': 'US'}
+
+# Searches issued concurrently across the whole process, and how long a request waits for them
+SEARCH_CONCURRENCY = int(os.getenv('SEARCH_CONCURRENCY', '8'))
+SEARCH_DEADLINE_SECONDS = float(os.getenv('SEARCH_DEADLINE_SECONDS', '8'))
+
+# Time a recommendation request may take (override per request with ?budget=<seconds>). A stage
+# whose expected cost no longer fits falls back to something cheaper: template explanations
+# first, then cached audio features only, then fewer searches. Model calls wait at most for
+# the time left, and fall back the same way when their batch does not finish in time.
+RECOMMENDATION_BUDGET_SECONDS = float(os.getenv('RECOMMENDATION_BUDGET_SECONDS', '20'))
+MAX_RECOMMENDATION_BUDGET_SECONDS = 60
+STAGE_COSTS = {
+    'explanations': float(os.getenv('BUDGET_EXPLANATION_SECONDS', '2')),
+    'audio_features': float(os.getenv('BUDGET_FEATURES_SECONDS', '0.5')),
+    'search': float(os.getenv('BUDGET_SEARCH_SECONDS', '1')),
+}
+
+def can_afford(budget, *stages):
+    """Whether the budget (None = unlimited) still covers the expected cost of these stages"""
+    return budget is None or budget.allows(sum(STAGE_COSTS[stage] for stage in stages))
+
+def degrade(budget, step):
+    """Record that a step fell back to its cheaper strategy"""
+    if budget is not None:
+        budget.skip(step)
+    metrics.inc('degraded', step=step)
+
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_CONCURRENCY, thread_name_prefix='spotify-search')
+
+def search_concurrently(queries, token, limit, deadline):
+    """Run spotify_search for every query in parallel, returning results in query order.
+    
+    Searches still running at the deadline (a time.monotonic() value) come back as None.
+    """
+    # Each search runs in the caller's context so its upstream calls count towards the request
+    futures = [search_executor.submit(in_context(spotify_search), query, token, limit) for query in queries]
+    wait(futures, timeout=max(0, deadline - time.monotonic()))
+    
+    results = []
+    for query, future in zip(queries, futures):
+        if not future.done():
+            future.cancel()
+            print(f"Search timed out: {query}")
+            results.append(None)
+        elif future.exception():
+            print(f"Search error: {future.exception()}")
+            results.append(None)
+        else:
+            results.append(future.result())
+    return results
 
 def get_audio_features(track_id, token):
-    """Get audio features for a track"""
+    """Get audio features for a track, read through the response cache and track store"""
+    found, _ = cached_audio_features([track_id])
+    if track_id in found:
+        return found[track_id]
+    return in_flight.do(('audio_features', track_id), fetch_audio_features, track_id, token)
+
+def fetch_audio_features(track_id, token):
     try:
-        response = requests.get(
-            f'https://api.spotify.com/v1/audio-features/{track_id}',
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        if response.status_code == 200:
-            return response.json()
+        return audio_features_from_response(spotify.get(f'/audio-features/{track_id}', token))
     except Exception as e:
         print(f"Audio features error: {e}")
     return None
 
+def get_audio_features_batch(track_ids, token):
+    """Get audio features for many tracks, 100 IDs per request"""
+    features, missing = cached_audio_features(track_ids)
+    
+    for start in range(0, len(missing), AUDIO_FEATURES_BATCH_SIZE):
+        chunk = tuple(missing[start:start + AUDIO_FEATURES_BATCH_SIZE])
+        features.update(in_flight.do(('audio_features_batch', chunk), fetch_audio_features_chunk, chunk, token))
+    
+    return features
+
+def fetch_audio_features_chunk(chunk, token):
+    try:
+        return audio_features_batch_from_response(spotify.get('/audio-features', token, params={'ids': ','.join(chunk)}))
+    except Exception as e:
+        print(f"Audio features batch error: {e}")
+    return {}
+
+# Set SCORER_EXTENDED_FEATURES to also compare acousticness, instrumentalness, loudness, key and mode
+similarity_scorer = SimilarityScorer(
+    extended=os.getenv('SCORER_EXTENDED_FEATURES', '').lower() in ('1', 'true', 'yes')
+)
+
+SENTIMENT_BATCH_SIZE = int(os.getenv('SENTIMENT_BATCH_SIZE', '32'))
+
+# Sentiment labels per text; "track name + artist" strings repeat across requests
+sentiment_memo = MemoryBackend(max_entries=50000)
+SENTIMENT_MEMO_TTL = 24 * 3600
+
+# How the user's description ranks candidates: "embedding" adds up to SEMANTIC_WEIGHT points by
+# the cosine similarity of the description to each candidate's title, artists and album;
+# "sentiment" adds 10 points when a candidate's sentiment label matches the description's
+DESCRIPTION_MATCHER = os.getenv('DESCRIPTION_MATCHER', 'embedding')
+SEMANTIC_WEIGHT = float(os.getenv('SEMANTIC_WEIGHT', '40'))
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+track_embeddings = EmbeddingCache(int(os.getenv('EMBEDDING_CACHE_SIZE', '50000')))
+
+def uses_embeddings():
+    return DESCRIPTION_MATCHER == 'embedding' and bool(text_embedder)
+
+def embed_description_steps(user_description, budget=None):
+    """The description's embedding, encoded once per request for every ranking step.
+    
+    None when the embedder is not in use, the description is empty, or encoding fails or runs
+    out of budget.
+    """
+    if not uses_embeddings() or not user_description.strip():
+        return None
+    try:
+        with metrics.span('embedding'):
+            embedding = (yield ModelCall(embedding_scheduler, [user_description], timeout=model_timeout(budget)))[0]
+    except TimeoutError:
+        # Out of time: rank on audio features alone
+        degrade(budget, 'description_match')
+        return None
+    except Exception as e:
+        # A failed or full embedder ranks on audio features alone too
+        print(f"Description embedding error: {e}")
+        degrade(budget, 'description_match')
+        return None
+    metrics.inc('model_items', 1, model='embedding')
+    return embedding
+
+def similarity_steps(description_embedding, tracks, timeout=None):
+    """Cosine similarity of the description's embedding to each track; only uncached tracks are encoded"""
+    with metrics.span('embedding'):
+        vectors, missing = track_embeddings.lookup(tracks)
+        if missing:
+            encoded = yield ModelCall(embedding_scheduler, [track_text(track) for track in missing], timeout=timeout)
+            vectors.update(track_embeddings.store(missing, encoded))
+        metrics.inc('model_items', len(missing), model='embedding')
+        return cosine_similarities(description_embedding, tracks, vectors)
+
+def analyze_sentiments(texts, timeout=None):
+    """Score many texts in batched sentiment pipeline calls, memoized per text"""
+    return run_steps(sentiment_steps(texts, timeout))
+
+def sentiment_steps(texts, timeout=None):
+    """analyze_sentiments as pipeline steps, yielding the uncached texts as a ModelCall"""
+    with metrics.span('sentiment'):
+        return (yield from _sentiment_steps(texts, timeout))
+
+def _sentiment_steps(texts, timeout):
+    results = {}
+    pending = []
+    for text in dict.fromkeys(texts):
+        cached = sentiment_memo.get(text)
+        if cached is not None:
+            results[text] = cached
+        else:
+            pending.append(text)
+    
+    if pending:
+        metrics.inc('model_items', len(pending), model='sentiment')
+        outputs = yield ModelCall(sentiment_scheduler, pending, timeout=timeout, flight=('sentiment', tuple(pending)))
+        for text, output in zip(pending, outputs):
+            results[text] = output
+            sentiment_memo.set(text, output, SENTIMENT_MEMO_TTL)
+    
+    return [results[text] for text in texts]
+
 def generate_ai_song_recommendations(user_description, original_track, token):
     """Generate AI-powered song recommendations using audio features"""
     if not text_generator:
@@ -323,7 +881,7 @@ def generate_feature_based_queries(audio_features, user_description, artist_name
     # Sentiment-based queries
     if sentiment_analyzer:
         try:
-            sentiment = sentiment_analyzer(user_description)[0]
+            sentiment = analyze_sentiments([user_description])[0]
             if sentiment['label'] == 'POSITIVE':
                 queries.extend(["similar uplifting songs", "positive indie music"])
             else:
@@ -372,7 +930,7 @@ def generate_ai_search_queries(user_description, original_track):
         
         # Add sentiment-based queries using AI
         if sentiment_analyzer:
-            sentiment = sentiment_analyzer(user_description)[0]
+            sentiment = analyze_sentiments([user_description])[0]
             if sentiment['label'] == 'NEGATIVE':
                 queries.extend(['emotional songs', 'melancholy music'])
             elif sentiment['label'] == 'POSITIVE':
@@ -386,19 +944,63 @@ def generate_ai_search_queries(user_description, original_track):
         print(f"Query generation error: {e}")
         return ['similar artists', 'indie music', 'alternative songs']
 
-def ai_filter_recommendations(tracks, user_description, original_track, token=None):
-    """AI-powered filtering prioritizing musical similarity"""
-    if not sentiment_analyzer:
+def ai_filter_recommendations(tracks, user_description, original_track, token=None, original_audio_features=None, track_features=None, budget=None, description_embedding=None):
+    """AI-powered filtering prioritizing musical similarity.
+    
+    With the embedder in use, candidates are matched against description_embedding, from
+    embed_description_steps, rather than the description's text.
+    """
+    return run_steps(filter_steps(
+        tracks, user_description, original_track, token, original_audio_features, track_features, budget,
+        description_embedding
+    ))
+
+def filter_steps(tracks, user_description, original_track, token=None, original_audio_features=None, track_features=None, budget=None, description_embedding=None):
+    """ai_filter_recommendations as pipeline steps, yielding its Spotify lookups and model calls"""
+    with metrics.span('filter'):
+        return (yield from _filter_steps(
+            tracks, user_description, original_track, token, original_audio_features, track_features, budget,
+            description_embedding
+        ))
+
+def _filter_steps(tracks, user_description, original_track, token, original_audio_features, track_features, budget, description_embedding):
+    use_embeddings = uses_embeddings()
+    if not use_embeddings and not sentiment_analyzer:
         return tracks
     
     try:
-        user_sentiment = sentiment_analyzer(user_description)[0]
-        original_audio_features = get_audio_features(original_track['id'], token) if token else None
-        scored_tracks = []
+        user_sentiment, track_sentiments, similarities = None, None, None
+        try:
+            if use_embeddings:
+                # Uncached candidates encoded in one batched forward pass
+                if description_embedding is not None:
+                    similarities = yield from similarity_steps(description_embedding, tracks, model_timeout(budget))
+            else:
+                # User description and every candidate scored in one batched call
+                track_texts = [f"{track['name']} {track['artists'][0]['name']}" for track in tracks]
+                sentiments = yield from sentiment_steps([user_description] + track_texts, model_timeout(budget))
+                user_sentiment, track_sentiments = sentiments[0], sentiments[1:]
+        except TimeoutError:
+            # Out of time: rank on audio features alone
+            degrade(budget, 'description_match')
         
-        for track in tracks:
-            score = ai_score_track(track, user_sentiment, user_description, original_audio_features, token)
-            scored_tracks.append((track, score))
+        if original_audio_features is None and token:
+            original_audio_features = yield Call(get_audio_features, original_track['id'], token)
+        
+        # One batched lookup for every candidate instead of one request per track
+        if track_features is None:
+            track_features = {}
+            if original_audio_features and token:
+                candidate_ids = [track['id'] for track in tracks]
+                if can_afford(budget, 'audio_features'):
+                    track_features = yield Call(get_audio_features_batch, candidate_ids, token)
+                else:
+                    # Out of time: score with whatever features are already cached
+                    degrade(budget, 'audio_features')
+                    track_features, _ = yield Call(cached_audio_features, candidate_ids)
+        
+        scores = ai_score_tracks(tracks, user_sentiment, original_audio_features, track_features, track_sentiments, similarities)
+        scored_tracks = list(zip(tracks, scores))
         
         scored_tracks.sort(key=lambda x: x[1], reverse=True)
         return [track for track, score in scored_tracks]
@@ -407,220 +1009,578 @@ def ai_filter_recommendations(tracks, user_description, original_track, token=No
         print(f"AI filtering error: {e}")
         return tracks
 
-def ai_score_track(track, user_sentiment, user_description, original_audio_features=None, token=None):
+def ai_score_track(track, user_sentiment, user_description, original_audio_features=None, token=None, *, track_features=None, track_sentiment=None):
     """Score tracks prioritizing musical similarity then user preferences"""
-    score = 50
-    match_quality = 'yellow'  # Default
+    if track_features is None and original_audio_features and token:
+        track_features = get_audio_features(track['id'], token)
+    if track_sentiment is None and sentiment_analyzer:
+        track_text = f"{track['name']} {track['artists'][0]['name']}"
+        track_sentiment = analyze_sentiments([track_text])[0]
     
+    return ai_score_tracks([track], user_sentiment, original_audio_features, {track['id']: track_features}, [track_sentiment])[0]
+
+def ai_score_tracks(tracks, user_sentiment, original_audio_features=None, track_features=None, track_sentiments=None, similarities=None):
+    """Score many tracks in one vectorized pass, musical similarity first then the description match"""
     try:
-        # Get audio features for similarity scoring
-        if original_audio_features and token:
-            track_features = get_audio_features(track['id'], token)
-            if track_features:
-                similarity_points = 0
-                
-                # Tempo similarity (most important)
-                tempo_diff = abs(original_audio_features.get('tempo', 120) - track_features.get('tempo', 120))
-                if tempo_diff < 10:
-                    score += 50
-                    similarity_points += 3
-                elif tempo_diff < 25:
-                    score += 30
-                    similarity_points += 2
-                elif tempo_diff < 40:
-                    score += 15
-                    similarity_points += 1
-                
-                # Energy similarity
-                energy_diff = abs(original_audio_features.get('energy', 0.5) - track_features.get('energy', 0.5))
-                if energy_diff < 0.15:
-                    score += 40
-                    similarity_points += 3
-                elif energy_diff < 0.3:
-                    score += 20
-                    similarity_points += 2
-                elif energy_diff < 0.5:
-                    score += 10
-                    similarity_points += 1
-                
-                # Valence similarity
-                valence_diff = abs(original_audio_features.get('valence', 0.5) - track_features.get('valence', 0.5))
-                if valence_diff < 0.2:
-                    score += 35
-                    similarity_points += 3
-                elif valence_diff < 0.4:
-                    score += 18
-                    similarity_points += 2
-                elif valence_diff < 0.6:
-                    score += 8
-                    similarity_points += 1
-                
-                # Danceability similarity
-                dance_diff = abs(original_audio_features.get('danceability', 0.5) - track_features.get('danceability', 0.5))
-                if dance_diff < 0.2:
-                    score += 20
-                    similarity_points += 1
-                
-                # Determine match quality based on similarity points
-                if similarity_points >= 8:
-                    match_quality = 'green'  # Excellent match
-                elif similarity_points >= 5:
-                    match_quality = 'yellow'  # Good match
-                else:
-                    match_quality = 'red'  # Weak match
+        track_features = track_features or {}
+        scores, qualities = similarity_scorer.score(
+            original_audio_features,
+            [track_features.get(track['id']) for track in tracks]
+        )
         
         # Secondary scoring: sentiment alignment
-        if sentiment_analyzer:
-            track_text = f"{track['name']} {track['artists'][0]['name']}"
-            track_sentiment = sentiment_analyzer(track_text)[0]
-            
-            if user_sentiment['label'] == track_sentiment['label']:
-                score += 10
+        if user_sentiment and track_sentiments:
+            for i, track_sentiment in enumerate(track_sentiments):
+                if track_sentiment and user_sentiment['label'] == track_sentiment['label']:
+                    scores[i] += 10
         
-        # Store match quality in track for sorting
-        track['match_quality'] = match_quality
-        track['similarity_score'] = score
+        # Or semantic closeness to the description; unrelated texts score near 0, so clip negatives
+        if similarities is not None:
+            scores += SEMANTIC_WEIGHT * similarities.clip(0, 1)
         
-        return score
+        # Store match quality in each track for sorting
+        results = []
+        for track, score, match_quality in zip(tracks, scores, qualities):
+            track['match_quality'] = match_quality
+            track['similarity_score'] = int(score)
+            results.append(int(score))
+        return results
         
     except Exception as e:
         print(f"Scoring error: {e}")
-        track['match_quality'] = 'yellow'
-        track['similarity_score'] = 50
-        return 50
+        for track in tracks:
+            track['match_quality'] = 'yellow'
+            track['similarity_score'] = 50
+        return [50] * len(tracks)
 
 
 
+token_manager = TokenManager(
+    CLIENT_ID, CLIENT_SECRET, http=spotify,
+    token_url=os.getenv('SPOTIFY_TOKEN_URL', TOKEN_URL)
+)
+spotify.token_manager = token_manager
+
+@metrics.span('token')
 def get_access_token():
-    if not CLIENT_ID or not CLIENT_SECRET:
-        return None
-        
-    auth_string = f"{CLIENT_ID}:{CLIENT_SECRET}"
-    auth_bytes = auth_string.encode('utf-8')
-    auth_base64 = base64.b64encode(auth_bytes).decode('utf-8')
-    
-    response = requests.post(
-        'https://accounts.spotify.com/api/token',
-        headers={'Authorization': f'Basic {auth_base64}'},
-        data={'grant_type': 'client_credentials'}
-    )
+    """Return the cached client-credentials token, refreshing it when needed"""
+    return token_manager.get_token()
+
+# Set SERVER_TIMING to send each request's stage timings and counters in a Server-Timing header.
+# Streamed responses only carry the stages that ran before their headers went out.
+SERVER_TIMING = os.getenv('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+
+metrics.register_stats('spotify', spotify.stats)
+metrics.register_stats('token', token_manager.stats)
+metrics.register_stats('response_cache', response_cache.stats)
+metrics.register_stats('generation_scheduler', generation_scheduler.stats)
+metrics.register_stats('sentiment_scheduler', sentiment_scheduler.stats)
+metrics.register_stats('embedding_scheduler', embedding_scheduler.stats)
+metrics.register_stats('track_embeddings', track_embeddings.stats)
+metrics.register_stats('in_flight', in_flight.stats)
+metrics.register_stats('feature_index', lambda: {'tracks': len(feature_index)})
+metrics.register_stats('track_store', track_store.stats)
+metrics.register_stats('typeahead', typeahead.stats)
+metrics.register_stats('models', lambda: {'ready': model_registry.ready(REQUIRED_MODELS)})
+
+@app.before_request
+def start_request_trace():
+    start_seeding()
+    metrics.start_trace()
+
+@app.after_request
+def add_server_timing(response):
+    trace = metrics.trace()
+    if SERVER_TIMING and trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+    metrics.inc('requests', endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip or brotli for JSON and static files. Event streams are left alone, since a
+    compressor would hold events back until it had a block's worth."""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if (not encoding or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype == 'text/event-stream'
+            or not compressible(response.mimetype, response.content_length or 0)):
+        return response
     
-    if response.status_code == 200:
-        return response.json().get('access_token')
-    return None
+    response.direct_passthrough = False
+    with metrics.span('compress'):
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # The body is no longer byte-for-byte the one the ETag was computed from
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    # Deferred until a streamed response finishes, so this covers the whole stream
+    trace = metrics.trace()
+    if trace is not None:
+        metrics.observe('request_seconds', trace.elapsed(), endpoint=request.endpoint or 'unknown')
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/warmup', methods=['POST'])
+def warm_up_models():
+    models = model_registry.warm_up_required(REQUIRED_MODELS)
+    ready = model_registry.ready(REQUIRED_MODELS)
+    return jsonify({'models': models, 'ready': ready}), 200 if ready else 503
+
+@app.route('/api/ready')
+def readiness():
+    """Readiness probe: 200 once the models these settings use are loaded. Unlike /api/warmup it
+    never loads anything."""
+    ready = model_registry.ready(REQUIRED_MODELS)
+    return jsonify({'models': model_registry.status(), 'ready': ready}), 200 if ready else 503
 
 @app.route('/api/search')
 def search_songs():
     query = request.args.get('q')
     if not query:
         return jsonify({'error': 'Query required'}), 400
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    local = local_search_body(query, fields)
+    if local is not None:
+        response = jsonify(local)
+        response.headers['X-Search-Source'] = 'local'
+        return response
     
     token = get_access_token()
-    response = requests.get(
-        f'https://api.spotify.com/v1/search?q={query}&type=track&limit=5&market=US',
-        headers={'Authorization': f'Bearer {token}'}
-    )
+    with metrics.span('search'):
+        status_code, results = spotify_search(query, token, limit=5)
     
-    if response.status_code != 200:
-        return jsonify({'error': f'Spotify API error: {response.status_code}', 'details': response.text}), response.status_code
+    if status_code != 200:
+        return jsonify({'error': f'Spotify API error: {status_code}', 'details': results}), status_code
     
-    return jsonify(response.json())
+    response = jsonify(spotify_search_body(results, fields))
+    response.headers['X-Search-Source'] = 'spotify'
+    return response
 
-@app.route('/api/ai-recommendations', methods=['POST'])
-def get_ai_recommendations():
+def local_search_body(query, fields):
+    """The /api/search body from the typeahead index, or None when Spotify has to answer.
+
+    Tracks seen before answer in memory; only queries they cannot fill go to Spotify. The index
+    keeps compact tracks, so fields=full (fields None) always goes to Spotify.
+    """
+    if fields is None:
+        return None
+    with metrics.span('typeahead'):
+        local = typeahead.search(query, limit=5)
+    if not TYPEAHEAD_MIN_RESULTS or len(local) < TYPEAHEAD_MIN_RESULTS:
+        return None
+    metrics.inc('search_answers', source='local')
+    items = [compact_track(track, fields) for track in local]
+    return {'tracks': {'items': items, 'limit': 5, 'offset': 0, 'total': len(local)}}
+
+def spotify_search_body(results, fields):
+    metrics.inc('search_answers', source='spotify')
+    tracks = results.get('tracks') or {}
+    items = [compact_track(track, fields) for track in tracks.get('items') or [] if track]
+    return {**results, 'tracks': {**tracks, 'items': items}}
+
+# Finished recommendation lists keyed by seed track and normalized description. "text" keys on the
+# description itself, "sentiment" buckets descriptions by their sentiment label.
+RESULT_CACHE_KEY = os.getenv('RESULT_CACHE_KEY', 'text')
+result_cache = ResultCache(
+    MemoryBackend(int(os.getenv('RESULT_CACHE_SIZE', '2000'))),
+    ttl=int(os.getenv('RESULT_CACHE_TTL', '600')),
+    stale_ttl=int(os.getenv('RESULT_CACHE_STALE_TTL', '3600'))
+)
+metrics.register_stats('result_cache', result_cache.stats)
+
+# Lists computed offline for popular seeds by `python precompute.py run`, read on a result cache miss
+precomputed = PrecomputedStore(
+    os.getenv('PRECOMPUTED_PATH', 'precomputed.db') or None,
+    max_age=int(os.getenv('PRECOMPUTED_MAX_AGE', str(7 * 24 * 3600)))
+)
+metrics.register_stats('precomputed', precomputed.stats)
+
+def normalize_description(user_description):
+    """Sanitize like generate_ai_recommendations_with_explanations, then fold case and spacing"""
+    text = user_description.replace('"', '').replace("'", '').strip()[:200]
+    return ' '.join(text.lower().split())
+
+def recommendation_cache_key(track_id, user_description):
+    description = normalize_description(user_description)
+    if RESULT_CACHE_KEY == 'sentiment' and description and sentiment_analyzer:
+        description = analyze_sentiments([description])[0]['label']
+    return f"{track_id}|{description}"
+
+def compute_recommendations(track_id, user_description):
+    """Run the whole pipeline outside a request, e.g. to refresh a stale cache entry"""
+    token = get_access_token()
+    track_data = get_track(track_id, token) if token else None
+    if not track_data:
+        return None
+    
+    budget = Budget(RECOMMENDATION_BUDGET_SECONDS)
+    recommendations, skipped = collect_recommendations(track_data, user_description, token, budget)
+    # A degraded list is not worth caching over the one being refreshed
+    return None if skipped else recommendations
+
+def collect_recommendations(track_data, user_description, token, budget):
+    """Run recommendation_events to completion; returns (sorted recommendations, skipped steps)"""
+    for event, payload in recommendation_events(track_data, user_description, token, budget):
+        if event == 'done':
+            return payload, list(budget.skipped)
+
+def cached_recommendations(track_id, user_description):
+    """Look up a finished recommendation list, refreshing stale entries in the background.
+    
+    Returns (cache key, recommendations or None, 'HIT' / 'STALE' / 'PRECOMPUTED' / 'MISS').
+    """
+    key = recommendation_cache_key(track_id, user_description)
+    recommendations, stale = result_cache.get(key)
+    if recommendations is None:
+        recommendations = precomputed.get(key)
+        if recommendations is not None:
+            result_cache.set(key, recommendations)
+            return key, recommendations, 'PRECOMPUTED'
+        return key, None, 'MISS'
+    if stale:
+        result_cache.revalidate(key, lambda: compute_recommendations(track_id, user_description))
+        return key, recommendations, 'STALE'
+    return key, recommendations, 'HIT'
+
+def parse_budget(value):
+    """A Budget for a ?budget=<seconds> parameter; a missing one gets the default.
     
+    Raises ValueError when the budget is not a number or out of range.
+    """
+    try:
+        seconds = RECOMMENDATION_BUDGET_SECONDS if value is None else float(value)
+    except ValueError:
+        raise ValueError('budget must be a number of seconds')
+    if not 0 < seconds <= MAX_RECOMMENDATION_BUDGET_SECONDS:
+        raise ValueError(f'budget must be between 0 and {MAX_RECOMMENDATION_BUDGET_SECONDS} seconds')
+    return Budget(seconds)
+
+def prepare_recommendation_request():
+    """Validate a recommendation request and load its seed track.
+    
+    Returns ((track_data, user_description, token, budget), None) or (None, error response).
+    """
     data = request.get_json()
     track_id = data.get('trackId')
     user_description = data.get('userDescription', '')
     
     if not track_id:
-        return jsonify({'error': 'Track ID required'}), 400
+        return None, (jsonify({'error': 'Track ID required'}), 400)
+    
+    try:
+        budget = parse_budget(request.args.get('budget'))
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
     
     token = get_access_token()
     if not token:
-        return jsonify({'error': 'Failed to get access token'}), 500
+        return None, (jsonify({'error': 'Failed to get access token'}), 500)
     
     # Get track details
-    track_response = requests.get(
-        f'https://api.spotify.com/v1/tracks/{track_id}',
-        headers={'Authorization': f'Bearer {token}'}
-    )
+    with metrics.span('track'):
+        track_data = get_track(track_id, token)
     
-    if track_response.status_code != 200:
-        return jsonify({'error': 'Track not found'}), 404
+    if not track_data:
+        return None, (jsonify({'error': 'Track not found'}), 404)
+    
+    return (track_data, user_description, token, budget), None
+
+class Call:
+    """A blocking step recommendation_steps hands to its driver: fn(*args), or a non-blocking
+    counterpart of fn in asgi.py. The driver sends the result back into the pipeline."""
     
-    track_data = track_response.json()
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+    
+    def run(self):
+        return self.fn(*self.args)
+
+def recommendation_events(track_data, user_description, token, budget):
+    """Run the recommendation pipeline, yielding (event, data) pairs as results become ready.
+    
+    Yields 'track' for each selected track, 'details' with its explanation and match quality
+    once those are generated, and finally 'done' with the re-sorted recommendations. Steps that
+    did not fit in the budget fall back to cheaper ones and are listed in budget.skipped.
+    """
+    steps = recommendation_steps(track_data, user_description, token, budget)
+    result, error = None, None
+    try:
+        while True:
+            try:
+                step = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration:
+                return
+            result, error = None, None
+            if isinstance(step, (Call, ModelCall)):
+                try:
+                    result = step.run()
+                except Exception as e:
+                    error = e
+            else:
+                yield step
+    finally:
+        steps.close()
+
+def recommendation_steps(track_data, user_description, token, budget):
+    """The pipeline behind recommendation_events, shared by both apps.
+    
+    Yields (event, data) pairs, a Call for every Spotify request or store lookup and a ModelCall
+    for every model call. The driver runs those and sends back the result, or throws in the
+    exception.
+    """
+    track_id = track_data['id']
     recommendations = []
+    explanation_queries = []
     existing_ids = {track_id}
-    artist_id = track_data['artists'][0]['id']
     artist_name = track_data['artists'][0]['name']
     
-    # Step 1: Get AI recommendations
-    ai_song_queries = generate_ai_recommendations_with_explanations(user_description, track_data, token)
+    def select(track, query):
+        recommendations.append(track)
+        explanation_queries.append(query)
+        existing_ids.add(track['id'])
+    
+    # The description is encoded once, by the first ranking step that needs it
+    description = {}
+    
+    def description_embedding():
+        if 'embedding' not in description:
+            description['embedding'] = yield from embed_description_steps(user_description, budget)
+        return description['embedding']
+    
+    # Searches must leave time to score their results
+    search_deadline = min(budget.until(STAGE_COSTS['audio_features']), time.monotonic() + SEARCH_DEADLINE_SECONDS)
+    
+    # Seed features are fetched once and shared by every step below
+    with metrics.span('seed_features'):
+        if can_afford(budget, 'audio_features'):
+            original_audio_features = (yield Call(get_audio_features, track_id, token)) or {}
+        else:
+            degrade(budget, 'audio_features')
+            original_audio_features = (yield Call(cached_audio_features, [track_id]))[0].get(track_id) or {}
+    
+    # Step 1: Get AI recommendations. generate_ai_recommendations_with_explanations currently
+    # returns no queries without calling a model, so there is nothing to save by skipping it
+    with metrics.span('ai_queries'):
+        ai_song_queries = yield Call(
+            generate_ai_recommendations_with_explanations, user_description, track_data, token, original_audio_features
+        )
+    
+    # Step 2: Search for each AI recommendation on Spotify
+    # All searches run at once; results are merged in the original priority order
+    with metrics.span('search'):
+        if ai_song_queries and (not can_afford(budget, 'search') or search_deadline <= time.monotonic()):
+            degrade(budget, 'search')
+            ai_song_queries = []
+        song_searches = yield Call(search_concurrently, ai_song_queries, token, 3, search_deadline)
     
-    # Step 2: Search for each AI recommendation on Spotify and generate explanations
-    for song_query in ai_song_queries:
+    for song_query, search in zip(ai_song_queries, song_searches):
         if len(recommendations) >= 9:
             break
-            
-        # Search for the song on Spotify
-        search_response = requests.get(
-            f'https://api.spotify.com/v1/search?q={song_query}&type=track&limit=3&market=US',
-            headers={'Authorization': f'Bearer {token}'}
-        )
+        if not search:
+            continue
         
-        if search_response.status_code == 200:
-            search_tracks = search_response.json()['tracks']['items']
+        status_code, search_results = search
+        if status_code == 200:
+            search_tracks = search_results['tracks']['items']
             
             for track in search_tracks:
                 if (track['id'] not in existing_ids and 
                     len(recommendations) < 9):
-                    # Generate individual explanation for this specific song
-                    track['ai_explanation'] = generate_individual_explanation(song_query, track_data, user_description, token)
-                    recommendations.append(track)
-                    existing_ids.add(track['id'])
+                    select(track, song_query)
+                    yield 'track', track
+                    break
+    
+    # Step 3: Fill from the local index of tracks with known audio features
+    if len(recommendations) < 9 and original_audio_features:
+        with metrics.span('neighbors'):
+            neighbors = yield Call(feature_index.query, original_audio_features, FEATURE_INDEX_NEIGHBORS, existing_ids)
+            neighbor_ids = [neighbor_id for neighbor_id, _ in neighbors]
+            if not neighbors:
+                neighbor_tracks = {}
+            elif can_afford(budget, 'audio_features'):
+                neighbor_tracks = yield Call(get_tracks, neighbor_ids, token)
+            else:
+                degrade(budget, 'track_lookups')
+                neighbor_tracks, _ = yield Call(cached_tracks, neighbor_ids)
+        if neighbors:
+            candidates = [neighbor_tracks[neighbor_id] for neighbor_id, _ in neighbors if neighbor_id in neighbor_tracks]
+            embedding = yield from description_embedding()
+            ranked = yield from filter_steps(candidates, user_description, track_data, token, original_audio_features, None, budget, embedding)
+            
+            for track in ranked:
+                if len(recommendations) >= 9:
                     break
+                if track['id'] not in existing_ids:
+                    select(track, f"{track['artists'][0]['name']} - {track['name']}")
+                    yield 'track', track
     
     # If we don't have enough recommendations, try broader searches
-    if len(recommendations) < 6:
+    if len(recommendations) < 6 and not can_afford(budget, 'search'):
+        degrade(budget, 'broader_search')
+    elif len(recommendations) < 6:
         broader_queries = [
             f"{artist_name} similar",
             f"artists like {artist_name}",
             f"songs similar to {track_data['name']}"
         ]
         
-        for query in broader_queries:
+        with metrics.span('search'):
+            broader_searches = yield Call(search_concurrently, broader_queries, token, 10, search_deadline)
+        
+        for query, search in zip(broader_queries, broader_searches):
             if len(recommendations) >= 9:
                 break
-                
-            search_response = requests.get(
-                f'https://api.spotify.com/v1/search?q={query}&type=track&limit=10&market=US',
-                headers={'Authorization': f'Bearer {token}'}
-            )
+            if budget.expired():
+                degrade(budget, 'broader_search')
+                break
+            if not search:
+                continue
             
-            if search_response.status_code == 200:
-                search_tracks = search_response.json()['tracks']['items']
-                filtered_tracks = ai_filter_recommendations(search_tracks, user_description, track_data, token)
+            status_code, search_results = search
+            if status_code == 200:
+                search_tracks = search_results['tracks']['items']
+                embedding = yield from description_embedding()
+                filtered_tracks = yield from filter_steps(search_tracks, user_description, track_data, token, original_audio_features, None, budget, embedding)
                 
                 for track in filtered_tracks[:3]:  # Take top 3 from each broader search
                     if (track['id'] not in existing_ids and 
                         len(recommendations) < 9):
-                        # Generate explanation for fallback tracks too
-                        track_query = f"{track['artists'][0]['name']} - {track['name']}"
-                        track['ai_explanation'] = generate_individual_explanation(track_query, track_data, user_description, token)
-                        recommendations.append(track)
-                        existing_ids.add(track['id'])
+                        select(track, f"{track['artists'][0]['name']} - {track['name']}")
+                        yield 'track', track
     
-    # Explanations already generated for each track in the search loop above
+    # Generate every explanation in one batch now that the candidates are chosen; this is the
+    # first thing dropped when time runs short, so it gets no reserve from earlier stages
+    explanations = None
+    if can_afford(budget, 'explanations'):
+        explanations = yield from explanation_steps(explanation_queries, track_data, user_description, budget)
+    if explanations is None:
+        degrade(budget, 'explanations')
+        explanations = template_explanations(recommendations, track_data, original_audio_features)
+    for track, explanation in zip(recommendations, explanations):
+        track['ai_explanation'] = explanation
+        yield 'details', {
+            'id': track['id'],
+            'ai_explanation': explanation,
+            'match_quality': track.get('match_quality', 'yellow'),
+            'similarity_score': track.get('similarity_score', 50)
+        }
     
     # Sort by match quality: green first, then yellow, then red
     quality_order = {'green': 0, 'yellow': 1, 'red': 2}
     recommendations.sort(key=lambda x: (quality_order.get(x.get('match_quality', 'yellow'), 1), -x.get('similarity_score', 50)))
     
-    return jsonify({
-        'tracks': recommendations,
+    yield 'done', recommendations
+
+def store_recommendations(cache_key, recommendations, skipped):
+    """Cache a finished list. Only complete lists are cached; a degraded one would be served to
+    requests with time to spare."""
+    if recommendations and not skipped:
+        result_cache.set(cache_key, recommendations)
+
+def recommendations_body(recommendations, skipped, fields):
+    return {
+        'tracks': [compact_track(track, fields) for track in recommendations],
+        'skipped': skipped,
         'debug': f'AI recommended {len(recommendations)} songs sorted by similarity strength'
-    })
+    }
+
+def recommendation_event(event, payload, skipped, fields):
+    """One pipeline event as a Server-Sent Event; 'done' carries the final order"""
+    if event == 'done':
+        payload = {
+            'order': [track['id'] for track in payload],
+            'skipped': skipped,
+            'debug': f'AI recommended {len(payload)} songs sorted by similarity strength'
+        }
+    elif event == 'track':
+        payload = compact_track(payload, fields)
+    return f"event: {event}\ndata: {dumps(payload).decode()}\n\n"
+
+@app.route('/api/ai-recommendations', methods=['POST'])
+def get_ai_recommendations():
+    data = request.get_json()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cache_key, recommendations, cache_status = cached_recommendations(data.get('trackId'), data.get('userDescription', ''))
+    
+    if recommendations is None:
+        seed, error = prepare_recommendation_request()
+        if error:
+            return error
+        
+        # Identical requests arriving while this one runs wait for its result, unless their own
+        # budget ends before this one's
+        recommendations, skipped = in_flight.do(
+            ('recommendations', cache_key), collect_recommendations, *seed, deadline=seed[3].deadline
+        )
+        store_recommendations(cache_key, recommendations, skipped)
+    else:
+        skipped = []
+    
+    response = jsonify(recommendations_body(recommendations, skipped, fields))
+    response.headers['X-Cache'] = cache_status
+    return response
+
+@app.route('/api/ai-recommendations/stream', methods=['POST'])
+def stream_ai_recommendations():
+    """Same pipeline as /api/ai-recommendations, sent as Server-Sent Events while it runs"""
+    data = request.get_json()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cache_key, cached, cache_status = cached_recommendations(data.get('trackId'), data.get('userDescription', ''))
+    
+    if cached is None:
+        seed, error = prepare_recommendation_request()
+        if error:
+            return error
+        budget = seed[3]
+        events = recommendation_events(*seed)
+    else:
+        budget = None
+        events = replay_recommendation_events(cached)
+    
+    def generate():
+        for event, payload in events:
+            skipped = list(budget.skipped) if budget else []
+            if event == 'done' and cached is None:
+                store_recommendations(cache_key, payload, skipped)
+            yield recommendation_event(event, payload, skipped, fields)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Cache': cache_status}
+    )
+
+def replay_recommendation_events(recommendations):
+    """Yield a cached recommendation list as the events recommendation_events would produce"""
+    for track in recommendations:
+        yield 'track', track
+    for track in recommendations:
+        yield 'details', {
+            'id': track['id'],
+            'ai_explanation': track.get('ai_explanation'),
+            'match_quality': track.get('match_quality', 'yellow'),
+            'similarity_score': track.get('similarity_score', 50)
+        }
+    yield 'done', recommendations
 
 if __name__ == '__main__':
     app.run(debug=True, port=8000)
\ No newline at end of file
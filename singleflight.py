@@ -0,0 +1,170 @@
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future, TimeoutError, wait
+
+
+class _Flights:
+    """Counts of executed and shared calls per key kind"""
+
+    def __init__(self):
+        self._calls = {}
+        # key -> the time.monotonic() deadline of the caller leading its flight, or None
+        self._deadlines = {}
+        self.executed = {}
+        self.shared = {}
+
+    def _count(self, key, leader):
+        kind = key[0] if isinstance(key, tuple) else key
+        counts = self.executed if leader else self.shared
+        counts[kind] = counts.get(kind, 0) + 1
+
+    def _joins(self, key, deadline):
+        """Whether a caller with deadline may wait on key's flight: only if its leader's is no later"""
+        leader_deadline = self._deadlines.get(key)
+        return deadline is None or (leader_deadline is not None and leader_deadline <= deadline)
+
+    def stats(self):
+        return {
+            kind: {'executed': self.executed.get(kind, 0), 'shared': self.shared.get(kind, 0)}
+            for kind in sorted(set(self.executed) | set(self.shared))
+        }
+
+
+class SingleFlight(_Flights):
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is still running
+    wait for and share its result (or exception) instead of repeating the work. Callers that
+    pass a deadline only share a flight whose leader has to finish by then too.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # key -> [futures, callers still waiting on them], for wait()
+        self._submitted = {}
+
+    def do(self, key, fn, *args, copy_result=False, deadline=None, **kwargs):
+        """Run fn(*args, **kwargs) once per in-flight key.
+
+        With copy_result, every caller gets its own deep copy, for results callers mutate. A
+        caller whose deadline (a time.monotonic() value) is earlier than the leader's runs fn on
+        its own rather than wait past it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+                self._deadlines[key] = deadline
+            elif not self._joins(key, deadline):
+                call = None
+            self._count(key, call is None or leader)
+
+        if call is None:
+            return fn(*args, **kwargs)
+        if not leader:
+            result = call.result()
+            return copy.deepcopy(result) if copy_result else result
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                self._deadlines.pop(key, None)
+        return copy.deepcopy(result) if copy_result else result
+
+    def wait(self, key, submit, *args, timeout=None, **kwargs):
+        """Share the futures of one submit(*args, **kwargs) among concurrent calls with the key,
+        each caller waiting on them for at most its own timeout, and return their results.
+
+        submit queues the work elsewhere (a BatchScheduler) and returns a list of futures, so
+        no caller's deadline is imposed on the others. The futures still pending are cancelled
+        once every caller sharing them has timed out.
+        """
+        flight = self.share(key, submit, *args, **kwargs)
+        futures = flight[0]
+        _, pending = wait(futures, timeout)
+        if pending:
+            self.abandon(key, flight, pending)
+            raise TimeoutError(f"{key[0] if isinstance(key, tuple) else key} results not ready after {timeout}s")
+        return [future.result() for future in futures]
+
+    def share(self, key, submit, *args, **kwargs):
+        """wait() for callers that wait on the futures themselves, say from an event loop.
+
+        Returns the flight, whose first item is the list of futures; a caller that stops
+        waiting before they are all done must hand it to abandon().
+        """
+        with self._lock:
+            flight = self._submitted.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._submitted[key] = [submit(*args, **kwargs), 0]
+            flight[1] += 1
+            self._count(key, leader)
+
+        if leader:
+            # Callbacks run right away for futures already done, so these are added unlocked
+            for future in flight[0]:
+                future.add_done_callback(lambda _: self._land(key, flight))
+            if not flight[0]:
+                self._land(key, flight)
+        return flight
+
+    def abandon(self, key, flight, pending):
+        """Stop waiting on a shared flight; its pending futures are cancelled if nobody else waits"""
+        with self._lock:
+            flight[1] -= 1
+            abandoned = not flight[1]
+            if abandoned and self._submitted.get(key) is flight:
+                del self._submitted[key]
+        if abandoned:
+            for future in pending:
+                future.cancel()
+
+    def _land(self, key, flight):
+        """Drop a shared flight once all of its futures are done"""
+        if all(future.done() for future in flight[0]):
+            with self._lock:
+                if self._submitted.get(key) is flight:
+                    del self._submitted[key]
+
+
+class AsyncSingleFlight(_Flights):
+    """SingleFlight for coroutine functions on one event loop.
+
+    The shared call runs as its own task, so a caller that is cancelled (say, by a search
+    deadline) does not cancel it for the others.
+    """
+
+    async def do(self, key, fn, *args, copy_result=False, deadline=None, **kwargs):
+        call = self._calls.get(key)
+        leader = call is None
+        if not leader and not self._joins(key, deadline):
+            self._count(key, True)
+            return await fn(*args, **kwargs)
+        if leader:
+            call = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = call
+            self._deadlines[key] = deadline
+            call.add_done_callback(lambda done: self._finish(key, done))
+        self._count(key, leader)
+
+        result = await asyncio.shield(call)
+        return copy.deepcopy(result) if copy_result else result
+
+    def _finish(self, key, call):
+        self._calls.pop(key, None)
+        self._deadlines.pop(key, None)
+        # Mark the exception retrieved even when every caller was cancelled before it arrived
+        if not call.cancelled():
+            call.exception()
@@ -0,0 +1,390 @@
+import asyncio
+import base64
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
+API_URL = 'https://api.spotify.com/v1'
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Token bucket shared by every thread making Spotify calls"""
+
+    def __init__(self, rate, burst=None):
+        # rate <= 0 disables limiting
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def try_acquire(self):
+        """Take a token and return 0, or return how long to wait before trying again"""
+        if self.rate <= 0 and not self._paused_until:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.rate <= 0:
+                return 0
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def pause(self, seconds):
+        """Hold back every caller, e.g. while Spotify's Retry-After window runs"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class SpotifyClient:
+    """Pooled HTTP session for Spotify with timeouts, retries and rate limiting"""
+
+    def __init__(self, timeout=10, max_retries=3, backoff=0.5, max_backoff=8,
+                 max_retry_after=30, rate_limit=0, pool_size=20, api_url=API_URL):
+        # Relative paths are resolved against api_url, which benchmarks point at a local fake
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # A Retry-After longer than this is returned to the caller instead of waited out
+        self.max_retry_after = max_retry_after
+        self.rate_limiter = RateLimiter(rate_limit)
+
+        self.session = self._create_session(pool_size)
+        # Optional callback(path, status, seconds) after every attempt; status 0 means no response
+        self.on_response = None
+        # Optional TokenManager; a 401 on a bearer request invalidates its token and retries once
+        self.token_manager = None
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def _create_session(self, pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get(self, url, token=None, params=None, **kwargs):
+        return self.request('GET', url, token=token, params=params, **kwargs)
+
+    def post(self, url, token=None, **kwargs):
+        return self.request('POST', url, token=token, **kwargs)
+
+    def request(self, method, url, token=None, **kwargs):
+        """Send a request, retrying throttled, failed and 5xx responses with jittered backoff"""
+        path = url
+        url, kwargs = self._prepare(url, token, kwargs)
+        response = self._send(method, url, path, kwargs)
+
+        if self._unauthorized(response, token):
+            fresh = self.token_manager.get_token()
+            if fresh and fresh != token:
+                url, kwargs = self._prepare(url, fresh, kwargs)
+                response = self._send(method, url, path, kwargs)
+        return response
+
+    def _send(self, method, url, path, kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            self.requests += 1
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._observe(path, 0, started)
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                time.sleep(self._backoff_delay(attempt))
+                continue
+
+            self._observe(path, response.status_code, started)
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            self.retries += 1
+            time.sleep(delay)
+
+        return response
+
+    def stats(self):
+        return {'requests': self.requests, 'retries': self.retries, 'throttled': self.throttled}
+
+    def _unauthorized(self, response, token):
+        """True when a bearer request was refused and the token was invalidated for one retry"""
+        if response.status_code != 401 or not token or self.token_manager is None:
+            return False
+        self.token_manager.invalidate(token)
+        return True
+
+    def _observe(self, path, status, started):
+        if self.on_response is not None:
+            self.on_response(path, status, time.perf_counter() - started)
+
+    def _prepare(self, url, token, kwargs):
+        if not url.startswith('http'):
+            url = f"{self.api_url}{url}"
+        if token:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, Authorization=f'Bearer {token}')
+        kwargs.setdefault('timeout', self.timeout)
+        return url, kwargs
+
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before retrying this response, or None to return it as is"""
+        if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+            return None
+
+        if response.status_code != 429:
+            return self._backoff_delay(attempt)
+
+        self.throttled += 1
+        delay = self._retry_after(response)
+        if delay is None:
+            delay = self._backoff_delay(attempt)
+        elif delay > self.max_retry_after:
+            return None
+        else:
+            delay += random.uniform(0, self.backoff)
+        # Other threads would only get throttled too, so hold them back as well
+        self.rate_limiter.pause(delay)
+        return delay
+
+    def _backoff_delay(self, attempt):
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _retry_after(self, response):
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+
+class AsyncSpotifyClient(SpotifyClient):
+    """Non-blocking variant of SpotifyClient on a pooled httpx.AsyncClient"""
+
+    def _create_session(self, pool_size):
+        import httpx
+
+        self._httpx = httpx
+        return httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=self.timeout
+        )
+
+    async def get(self, url, token=None, params=None, **kwargs):
+        return await self.request('GET', url, token=token, params=params, **kwargs)
+
+    async def post(self, url, token=None, **kwargs):
+        return await self.request('POST', url, token=token, **kwargs)
+
+    async def request(self, method, url, token=None, **kwargs):
+        path = url
+        url, kwargs = self._prepare(url, token, kwargs)
+        response = await self._send(method, url, path, kwargs)
+
+        if self._unauthorized(response, token):
+            # get_token() may POST to the token endpoint, so it runs off the event loop
+            fresh = await asyncio.to_thread(self.token_manager.get_token)
+            if fresh and fresh != token:
+                url, kwargs = self._prepare(url, fresh, kwargs)
+                response = await self._send(method, url, path, kwargs)
+        return response
+
+    async def _send(self, method, url, path, kwargs):
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire_async()
+            self.requests += 1
+            started = time.perf_counter()
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except (self._httpx.TransportError, self._httpx.TimeoutException):
+                self._observe(path, 0, started)
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+
+            self._observe(path, response.status_code, started)
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        return response
+
+    async def aclose(self):
+        await self.session.aclose()
+
+
+class TokenManager:
+    """Caches the client-credentials token and refreshes it ahead of expiry"""
+
+    def __init__(self, client_id, client_secret, expiry_margin=60, refresh_ahead=300, http=None,
+                 token_url=TOKEN_URL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        # Anything with a requests-style post(), normally the shared SpotifyClient
+        self.http = http or requests
+        # Treat the token as expired this many seconds before Spotify does
+        self.expiry_margin = expiry_margin
+        # Start a background refresh once less than this many seconds remain
+        self.refresh_ahead = refresh_ahead
+
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        # Held while a background refresh runs; only ever acquired without blocking
+        self._refresh_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.background_refreshes = 0
+        self.failures = 0
+
+    def get_token(self):
+        """Return a valid access token, fetching one only when needed"""
+        if not self.client_id or not self.client_secret:
+            return None
+
+        token = self.peek()
+        if token:
+            return token
+
+        # Only one thread fetches; the rest wait on the lock and reuse its result
+        with self._lock:
+            token, _ = self._current()
+            if token:
+                self.hits += 1
+                return token
+            self.misses += 1
+            return self._refresh()
+
+    def peek(self):
+        """Return the cached token without blocking, or None when it has to be fetched"""
+        token, remaining = self._current()
+        if token:
+            self.hits += 1
+            if remaining < self.refresh_ahead:
+                self._start_background_refresh()
+        return token
+
+    def invalidate(self, token=None):
+        """Drop the cached token, e.g. after Spotify answers 401
+
+        Given the token that was refused, only drops it if it is still the cached one, so
+        concurrent 401s for the same token trigger a single refresh.
+        """
+        with self._lock:
+            if token is not None and token != self._token:
+                return
+            self._token = None
+            self._expires_at = 0.0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'background_refreshes': self.background_refreshes,
+            'failures': self.failures,
+            'expires_in': max(0, int(self._expires_at - self.expiry_margin - time.time())),
+        }
+
+    def _current(self):
+        remaining = self._expires_at - self.expiry_margin - time.time()
+        if self._token and remaining > 0:
+            return self._token, remaining
+        return None, 0
+
+    def _refresh(self):
+        """Fetch a new token; caller must hold self._lock"""
+        fetched = self._fetch()
+        if fetched:
+            self._store(*fetched)
+        return self._current()[0]
+
+    def _fetch(self):
+        """POST for a new token and return (token, expires_in), or None on failure. Takes no lock."""
+        auth_string = f"{self.client_id}:{self.client_secret}"
+        auth_base64 = base64.b64encode(auth_string.encode('utf-8')).decode('utf-8')
+
+        try:
+            response = self.http.post(
+                self.token_url,
+                headers={'Authorization': f'Basic {auth_base64}'},
+                data={'grant_type': 'client_credentials'},
+                timeout=10
+            )
+        except Exception as e:
+            print(f"Token refresh error: {e}")
+            self.failures += 1
+            return None
+
+        if response.status_code != 200:
+            print(f"Token refresh failed: {response.status_code}")
+            self.failures += 1
+            return None
+
+        payload = response.json()
+        return payload.get('access_token'), payload.get('expires_in', 3600)
+
+    def _store(self, token, expires_in):
+        """Swap in a fetched token; caller must hold self._lock"""
+        self._token = token
+        self._expires_at = time.time() + expires_in
+        self.refreshes += 1
+
+    def _start_background_refresh(self):
+        # Test-and-set without waiting: threads that find a refresh running keep using their valid token
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                # Another thread may have refreshed while we were starting
+                if self._current()[1] >= self.refresh_ahead:
+                    return
+                self.background_refreshes += 1
+                # The POST runs outside self._lock, which is only taken to swap the new token in
+                fetched = self._fetch()
+                if fetched:
+                    with self._lock:
+                        self._store(*fetched)
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=run, name='spotify-token-refresh', daemon=True).start()
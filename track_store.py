@@ -0,0 +1,227 @@
+"""Durable store of Spotify track metadata and audio features.
+
+Audio features never change for a track, so once stored they are served from disk for good;
+track metadata is kept for max_track_age seconds. Pre-warm a node before it takes traffic:
+
+    python track_store.py warm --ids ids.txt --playlist 37i9dQZF1DXcBWIGoYBM5M
+    python track_store.py stats
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from connection import ProcessConnection
+
+PLAYLIST_PAGE_SIZE = 100
+# Spotify caps /v1/tracks and /v1/audio-features at these many IDs per call
+TRACKS_BATCH_SIZE = 50
+AUDIO_FEATURES_BATCH_SIZE = 100
+
+
+class TrackStore:
+    """SQLite tables of track and audio-feature JSON keyed by track ID, written in bulk upserts.
+
+    With no path the store is disabled: lookups find nothing and upserts are dropped.
+    """
+
+    def __init__(self, path='tracks.db', max_track_age=7 * 24 * 3600):
+        self.path = path
+        self.max_track_age = max_track_age
+        self._db = ProcessConnection(
+            path,
+            'PRAGMA journal_mode=WAL',
+            'PRAGMA synchronous=NORMAL',
+            'CREATE TABLE IF NOT EXISTS tracks (id TEXT PRIMARY KEY, data TEXT, updated_at REAL)',
+            'CREATE TABLE IF NOT EXISTS audio_features (id TEXT PRIMARY KEY, data TEXT, updated_at REAL)',
+        )
+        self._lock = threading.Lock()
+
+        self.hits = {}
+        self.misses = {}
+        self.writes = {}
+
+    def __bool__(self):
+        return bool(self.path)
+
+    def get_tracks(self, track_ids):
+        """Return {id: track} for the stored, not yet stale, tracks among track_ids"""
+        return self._get_many('tracks', track_ids, time.time() - self.max_track_age)
+
+    def get_audio_features(self, track_ids):
+        """Return {id: features} for the stored tracks among track_ids"""
+        return self._get_many('audio_features', track_ids, 0)
+
+    def upsert_tracks(self, tracks):
+        self._upsert('tracks', tracks)
+
+    def upsert_audio_features(self, features):
+        self._upsert('audio_features', features)
+
+    def missing_audio_features(self, track_ids):
+        """The track_ids that have no stored audio features yet"""
+        found = self.get_audio_features(track_ids)
+        return [track_id for track_id in dict.fromkeys(track_ids) if track_id not in found]
+
+    def iter_tracks(self, batch_size=5000):
+        """Yield {id: track} dicts covering every stored track"""
+        return self._iter('tracks', batch_size)
+
+    def iter_audio_features(self, batch_size=5000):
+        """Yield {id: features} dicts covering every stored track"""
+        return self._iter('audio_features', batch_size)
+
+    def _iter(self, table, batch_size):
+        if not self.path:
+            return
+        last_id = ''
+        while True:
+            with self._lock:
+                rows = self._db.get().execute(
+                    f'SELECT id, data FROM {table} WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield {track_id: json.loads(data) for track_id, data in rows}
+
+    def stats(self):
+        counts = {'tracks': 0, 'audio_features': 0}
+        if self.path:
+            with self._lock:
+                for table in counts:
+                    counts[table] = self._db.get().execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        return {
+            table: {
+                'rows': counts[table],
+                'hits': self.hits.get(table, 0),
+                'misses': self.misses.get(table, 0),
+                'writes': self.writes.get(table, 0),
+            }
+            for table in counts
+        }
+
+    def _get_many(self, table, track_ids, min_updated_at):
+        track_ids = list(dict.fromkeys(track_ids))
+        if not self.path or not track_ids:
+            return {}
+        found = {}
+        with self._lock:
+            conn = self._db.get()
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(track_ids), 500):
+                chunk = track_ids[start:start + 500]
+                rows = conn.execute(
+                    f'SELECT id, data FROM {table} WHERE updated_at >= ? AND id IN ({",".join("?" * len(chunk))})',
+                    [min_updated_at, *chunk]
+                ).fetchall()
+                for track_id, data in rows:
+                    found[track_id] = json.loads(data)
+        self.hits[table] = self.hits.get(table, 0) + len(found)
+        self.misses[table] = self.misses.get(table, 0) + len(track_ids) - len(found)
+        return found
+
+    def _upsert(self, table, items):
+        if not self.path:
+            return
+        now = time.time()
+        rows = [(item['id'], json.dumps(item), now) for item in items if item and item.get('id')]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._db.get()
+            conn.executemany(f'INSERT OR REPLACE INTO {table} (id, data, updated_at) VALUES (?, ?, ?)', rows)
+            conn.commit()
+        self.writes[table] = self.writes.get(table, 0) + len(rows)
+
+
+def playlist_track_ids(client, token, playlist_id):
+    """Every track ID in a playlist, following Spotify's pagination"""
+    track_ids = []
+    url = f'/playlists/{playlist_id}/tracks'
+    params = {'fields': 'items(track(id,type)),next', 'limit': PLAYLIST_PAGE_SIZE}
+    while url:
+        response = client.get(url, token, params=params)
+        if response.status_code != 200:
+            print(f"Playlist {playlist_id} failed: {response.status_code}")
+            break
+        page = response.json()
+        for item in page.get('items') or []:
+            track = item.get('track') or {}
+            if track.get('id') and track.get('type', 'track') == 'track':
+                track_ids.append(track['id'])
+        # The next link is absolute and already carries the query string
+        url = page.get('next')
+        params = None
+    return track_ids
+
+
+def warm(store, client, token, track_ids):
+    """Fetch metadata and audio features for every track not in the store yet, in batched requests"""
+    track_ids = list(dict.fromkeys(track_ids))
+    stored_tracks = store.get_tracks(track_ids)
+    missing_tracks = [track_id for track_id in track_ids if track_id not in stored_tracks]
+    missing_features = store.missing_audio_features(track_ids)
+    print(f"{len(track_ids)} tracks: fetching {len(missing_tracks)} track objects and {len(missing_features)} audio features")
+
+    for start in range(0, len(missing_tracks), TRACKS_BATCH_SIZE):
+        chunk = missing_tracks[start:start + TRACKS_BATCH_SIZE]
+        response = client.get('/tracks', token, params={'ids': ','.join(chunk), 'market': 'US'})
+        if response.status_code == 200:
+            store.upsert_tracks(response.json().get('tracks') or [])
+        else:
+            print(f"Tracks batch failed: {response.status_code}")
+
+    for start in range(0, len(missing_features), AUDIO_FEATURES_BATCH_SIZE):
+        chunk = missing_features[start:start + AUDIO_FEATURES_BATCH_SIZE]
+        response = client.get('/audio-features', token, params={'ids': ','.join(chunk)})
+        if response.status_code == 200:
+            store.upsert_audio_features(response.json().get('audio_features') or [])
+        else:
+            print(f"Audio features batch failed: {response.status_code}")
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Manage the local track and audio-feature store')
+    parser.add_argument('--path', default=os.getenv('TRACK_STORE_PATH', 'tracks.db'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    warm_parser = commands.add_parser('warm', help='fetch tracks and audio features into the store')
+    warm_parser.add_argument('track_ids', nargs='*', help='Spotify track IDs')
+    warm_parser.add_argument('--ids', help='file with one track ID per line')
+    warm_parser.add_argument('--playlist', action='append', default=[], help='playlist ID (repeatable)')
+    commands.add_parser('stats', help='show row counts')
+    args = parser.parse_args()
+
+    store = TrackStore(args.path)
+    if args.command == 'stats':
+        for table, stats in store.stats().items():
+            print(f"{table}: {stats['rows']} rows")
+    else:
+        from spotify_client import API_URL, TOKEN_URL, SpotifyClient, TokenManager
+
+        client = SpotifyClient(
+            rate_limit=float(os.getenv('SPOTIFY_RATE_LIMIT', '0')),
+            api_url=os.getenv('SPOTIFY_API_URL', API_URL)
+        )
+        token = TokenManager(
+            os.getenv('SPOTIFY_CLIENT_ID'), os.getenv('SPOTIFY_CLIENT_SECRET'), http=client,
+            token_url=os.getenv('SPOTIFY_TOKEN_URL', TOKEN_URL)
+        ).get_token()
+        if not token:
+            raise SystemExit('Could not get a Spotify token; check SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET')
+
+        track_ids = list(args.track_ids)
+        if args.ids:
+            with open(args.ids) as f:
+                track_ids += f.read().split()
+        for playlist_id in args.playlist:
+            track_ids += playlist_track_ids(client, token, playlist_id)
+
+        warm(store, client, token, track_ids)
+        for table, stats in store.stats().items():
+            print(f"{table}: {stats['rows']} rows")
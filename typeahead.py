@@ -0,0 +1,111 @@
+import heapq
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from payload import compact_track
+
+# Prefixes longer than this are matched by checking the candidates' words directly
+MAX_PREFIX = 8
+
+
+def tokenize(text):
+    """Lowercase words with accents folded, so "Beyoncé" matches "beyonce" """
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+class TypeaheadIndex:
+    """In-memory prefix index over the titles and artists of every track we have seen.
+
+    Each word of a track's name and artists is indexed under all of its prefixes, so a query
+    is the intersection of one posting set per query word. The oldest tracks are evicted once
+    max_tracks is reached.
+    """
+
+    def __init__(self, max_tracks=50000):
+        self.max_tracks = max_tracks
+        self._tracks = OrderedDict()
+        self._words = {}
+        self._titles = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def add(self, track):
+        self.add_many([track])
+
+    def add_many(self, tracks):
+        with self._lock:
+            for track in tracks:
+                if not track or not track.get('id') or self.max_tracks <= 0:
+                    continue
+                track_id = track['id']
+                if track_id in self._tracks:
+                    # Refresh metadata (popularity changes) without re-indexing
+                    self._tracks[track_id] = compact_track(track)
+                    self._tracks.move_to_end(track_id)
+                    continue
+
+                words = set(tokenize(' '.join([track.get('name', '')] + [a.get('name', '') for a in track.get('artists') or []])))
+                self._tracks[track_id] = compact_track(track)
+                self._words[track_id] = words
+                self._titles[track_id] = ' '.join(tokenize(track.get('name', '')))
+                for word in words:
+                    for end in range(1, min(len(word), MAX_PREFIX) + 1):
+                        self._postings.setdefault(word[:end], set()).add(track_id)
+
+                while len(self._tracks) > self.max_tracks:
+                    self._evict()
+
+    def search(self, query, limit=5):
+        """Return up to limit tracks whose words start with every word of the query, most popular first"""
+        words = tokenize(query)
+        if not words:
+            return []
+
+        with self._lock:
+            postings = []
+            for word in words:
+                posting = self._postings.get(word[:MAX_PREFIX])
+                if not posting:
+                    return []
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = postings[0]
+            for posting in postings[1:]:
+                candidates = candidates & posting
+                if not candidates:
+                    return []
+
+            long_words = [word for word in words if len(word) > MAX_PREFIX]
+            if long_words:
+                candidates = {
+                    track_id for track_id in candidates
+                    if all(any(w.startswith(word) for w in self._words[track_id]) for word in long_words)
+                }
+
+            # Titles that start with the query beat other matches, then popularity decides
+            phrase = ' '.join(words)
+            best = heapq.nlargest(
+                limit, candidates,
+                key=lambda track_id: (self._titles[track_id].startswith(phrase), self._tracks[track_id].get('popularity') or 0)
+            )
+            return [self._tracks[track_id] for track_id in best]
+
+    def stats(self):
+        return {'tracks': len(self._tracks), 'prefixes': len(self._postings)}
+
+    def _evict(self):
+        track_id, _ = self._tracks.popitem(last=False)
+        self._titles.pop(track_id, None)
+        for word in self._words.pop(track_id, ()):
+            for end in range(1, min(len(word), MAX_PREFIX) + 1):
+                posting = self._postings.get(word[:end])
+                if posting is not None:
+                    posting.discard(track_id)
+                    if not posting:
+                        del self._postings[word[:end]]